@@ -0,0 +1,135 @@
+'''
+Synthetic model point (.PRO) and table (.fac) files for benchmarking
+
+e.g. python benchmarks/mpf_generator.py bench-data/ --files 20 --rows 100000
+'''
+import argparse
+import csv
+from pathlib import Path
+import numpy as np
+import pandas as pd
+
+# columns always present, with their VARIABLE_TYPES
+BASE_COLUMNS = [
+    ('SPCODE', 'N'),
+    ('POLICY_NUMBER', 'T10'),
+    ('PLAN_CODE', 'T6'),
+    ('AGE_AT_ENTRY', 'S'),
+    ('SEX', 'T1'),
+    ('SMOKER', 'T1'),
+    ('ANNUAL_PREM', 'N'),
+    ('SUM_ASSURED', 'N'),
+    ('INIT_POLS_IF', 'N'),
+    ('POL_TERM_Y', 'I'),
+    ('PREM_FREQ', 'I'),
+    ('EFF_YEAR', 'I'),
+]
+
+FOOTER = '''
+Report generated by DCS
+Total records,{rows}
+*,not,a,data,line
+'''
+
+def _column(rng, name, variable_type, rows, prod_index):
+    if name == 'POLICY_NUMBER':
+        return np.char.add('P{:03d}'.format(prod_index), np.arange(rows).astype('U7'))
+    if name == 'PLAN_CODE':
+        return rng.choice(['ABC1', 'XYZ123', 'DEF22', 'GHI3', 'JKL'], rows)
+    if name == 'SEX':
+        return rng.choice(['M', 'F'], rows)
+    if name == 'SMOKER':
+        return rng.choice(['S', 'N'], rows)
+    if name == 'SPCODE':
+        return rng.choice([101000, 301000, 501000], rows)
+    if name == 'AGE_AT_ENTRY':
+        return rng.integers(0, 80, rows)
+    if name == 'PREM_FREQ':
+        return rng.choice([1, 2, 4, 12], rows)
+    if name == 'EFF_YEAR':
+        return rng.integers(1990, 2024, rows)
+    if variable_type[0] == 'T':
+        return rng.choice(['A', 'BB', 'CCC', 'DDDD'], rows)
+    if variable_type[0] in ['I', 'S']:
+        return rng.integers(0, 1000, rows)
+    if variable_type[0] == 'D':
+        return pd.Timestamp('2000-01-01') + pd.to_timedelta(rng.integers(0, 9000, rows), unit='D')
+    return np.round(rng.random(rows) * 100000, 2)
+
+'''
+columns: total number of data columns (at least the base columns), extra ones follow types_mix
+types_mix: VARIABLE_TYPES cycled for the extra columns
+date_columns: number of extra date columns (type Dmm/dd/yyyy)
+'''
+def generate_mpf(path, rows, columns=len(BASE_COLUMNS), types_mix=('N', 'I', 'T4'), date_columns=1, footer=True, seed=0, prod_index=0):
+    rng = np.random.default_rng(seed)
+    specs = list(BASE_COLUMNS)
+    specs.extend(('DATE_{}'.format(i + 1), 'Dmm/dd/yyyy') for i in range(date_columns))
+    extra = max(0, columns - len(specs))
+    specs.extend(('EXTRA_{}'.format(i + 1), types_mix[i % len(types_mix)]) for i in range(extra))
+
+    df = pd.DataFrame({
+        name: _column(rng, name, variable_type, rows, prod_index)
+        for name, variable_type in specs
+    })
+    with open(path, 'w', newline='\r\n') as f:
+        f.write('Output_Format, MPF_FORMAT\n')
+        f.write('NUMLINES, {:>9}\n'.format(rows))
+        f.write('VARIABLE_TYPES,T1,' + ','.join(t for _, t in specs) + '\n')
+        f.write('!,' + ','.join(name for name, _ in specs) + '\n')
+        lines = df.to_csv(index=False, header=False, lineterminator='\n', date_format='%m/%d/%Y', quoting=csv.QUOTE_MINIMAL)
+        f.write('*,' + lines[:-1].replace('\n', '\n*,') + '\n')
+        if footer:
+            f.write(FOOTER.format(rows=rows))
+    return Path(path)
+
+def generate_folder(folder, files, rows, seed=0, **kwargs):
+    folder = Path(folder)
+    folder.mkdir(parents=True, exist_ok=True)
+    return [
+        generate_mpf(folder / 'C{:06d}.PRO'.format(i), rows, seed=seed + i, prod_index=i, **kwargs)
+        for i in range(files)
+    ]
+
+'''
+.fac table keyed by age, sex, smoker and duration, with one rate column per term
+'''
+def generate_fac(path, max_age=100, durations=50, rate_columns=5, seed=0):
+    rng = np.random.default_rng(seed)
+    index = pd.MultiIndex.from_product(
+        [range(max_age + 1), ['M', 'F'], ['S', 'N'], range(1, durations + 1)],
+        names=['AGE', 'SEX', 'SMOKER', 'DURATION'],
+    )
+    df = pd.DataFrame(
+        np.round(rng.random((len(index), rate_columns)), 6),
+        index=index,
+        columns=['RATE_{}'.format(i + 1) for i in range(rate_columns)],
+    ).reset_index()
+    with open(path, 'w', newline='\r\n') as f:
+        f.write('Synthetic rate table\n')
+        f.write('!5,' + ','.join(df.columns) + '\n')
+        lines = df.to_csv(index=False, header=False, lineterminator='\n')
+        f.write('*,' + lines[:-1].replace('\n', '\n*,') + '\n')
+        f.write(FOOTER.format(rows=len(df)))
+    return Path(path)
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser(description='Generate synthetic model point files')
+    parser.add_argument('folder')
+    parser.add_argument('--files', type=int, default=10)
+    parser.add_argument('--rows', type=int, default=10000)
+    parser.add_argument('--columns', type=int, default=30)
+    parser.add_argument('--date-columns', type=int, default=1)
+    parser.add_argument('--no-footer', action='store_true')
+    parser.add_argument('--seed', type=int, default=0)
+    args = parser.parse_args()
+    generate_folder(
+        args.folder,
+        args.files,
+        args.rows,
+        seed=args.seed,
+        columns=args.columns,
+        date_columns=args.date_columns,
+        footer=not args.no_footer,
+    )
+    generate_fac(Path(args.folder) / 'RATES.fac', seed=args.seed)
@@ -0,0 +1,122 @@
+'''
+Benchmarks of the load and export hot paths on synthetic files (see mpf_generator.py)
+
+e.g. python benchmarks/run_benchmarks.py --files 20 --rows 50000 --output bench.json
+
+Each benchmark is timed without tracing, then run again under tracemalloc for the peak memory.
+Results are written as JSON for comparing releases.
+'''
+import argparse
+import json
+import platform
+import shutil
+import sys
+import tempfile
+import time
+import tracemalloc
+from pathlib import Path
+
+sys.path.insert(0, str(Path(__file__).resolve().parent.parent))
+
+import pandas as pd
+import mpfi
+from mpfi.util import get_meta
+from mpf_generator import generate_folder, generate_fac
+
+def _run(func, repeat):
+    timings = []
+    for _ in range(repeat):
+        start = time.perf_counter()
+        rows = func()
+        timings.append(time.perf_counter() - start)
+    tracemalloc.start()
+    func()
+    _, peak = tracemalloc.get_traced_memory()
+    tracemalloc.stop()
+    return rows, min(timings), peak
+
+def _result(name, rows, bytes_processed, seconds, peak):
+    return {
+        'name': name,
+        'rows': rows,
+        'bytes': bytes_processed,
+        'seconds': round(seconds, 6),
+        'rows_per_second': round(rows / seconds, 1) if seconds > 0 else None,
+        'mb_per_second': round(bytes_processed / 1024 ** 2 / seconds, 3) if seconds > 0 else None,
+        'peak_memory_mb': round(peak / 1024 ** 2, 3),
+    }
+
+def run_benchmarks(data_folder, output_folder, repeat=3, workers=None):
+    files = sorted(Path(data_folder).glob('*.PRO'))
+    pattern = str(Path(data_folder) / '*.PRO')
+    fac_file = Path(data_folder) / 'RATES.fac'
+    input_bytes = sum(f.stat().st_size for f in files)
+    total_rows = sum(get_meta(f)['rows'] for f in files)
+    results = []
+
+    def meta():
+        for f in files:
+            get_meta(f)
+        return total_rows
+    rows, seconds, peak = _run(meta, repeat)
+    results.append(_result('get_meta', rows, input_bytes, seconds, peak))
+
+    rows, seconds, peak = _run(lambda: len(mpfi.load_mpf(pattern, workers=workers)), repeat)
+    results.append(_result('load_mpf', rows, input_bytes, seconds, peak))
+
+    rows, seconds, peak = _run(lambda: len(mpfi.load_mpf(
+        pattern,
+        workers=workers,
+        columns=['POLICY_NUMBER', 'SUM_ASSURED', 'ANNUAL_PREM'],
+        filter=[('PLAN_CODE', 'in', ['ABC1', 'XYZ123'])],
+    )), repeat)
+    results.append(_result('load_mpf_filter', rows, input_bytes, seconds, peak))
+
+    rows, seconds, peak = _run(lambda: len(mpfi.load_fac(fac_file)), repeat)
+    results.append(_result('load_fac', rows, fac_file.stat().st_size, seconds, peak))
+
+    df = mpfi.load_mpf(pattern)
+    export_folder = Path(output_folder) / 'export'
+    def export():
+        mpfi.export_mpf(df, str(export_folder), {'overwrite': 'always', 'workers': workers})
+        return len(df)
+    rows, seconds, peak = _run(export, repeat)
+    output_bytes = sum(f.stat().st_size for f in export_folder.iterdir())
+    results.append(_result('export_mpf', rows, output_bytes, seconds, peak))
+
+    return results
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser(description='Benchmark mpfi load and export')
+    parser.add_argument('--data', help='folder of existing *.PRO files and RATES.fac, generated if not given')
+    parser.add_argument('--files', type=int, default=10)
+    parser.add_argument('--rows', type=int, default=20000)
+    parser.add_argument('--columns', type=int, default=30)
+    parser.add_argument('--repeat', type=int, default=3)
+    parser.add_argument('--workers', type=int, default=None)
+    parser.add_argument('--output', help='JSON file for the results, printed if not given')
+    args = parser.parse_args()
+
+    work_folder = Path(tempfile.mkdtemp(prefix='mpfi-bench-'))
+    try:
+        data_folder = args.data
+        if data_folder is None:
+            data_folder = work_folder / 'data'
+            generate_folder(data_folder, args.files, args.rows, columns=args.columns)
+            generate_fac(data_folder / 'RATES.fac')
+        report = {
+            'python': platform.python_version(),
+            'pandas': pd.__version__,
+            'platform': platform.platform(),
+            'parameters': vars(args),
+            'results': run_benchmarks(data_folder, work_folder, args.repeat, args.workers),
+        }
+    finally:
+        shutil.rmtree(work_folder, ignore_errors=True)
+
+    output = json.dumps(report, indent=2)
+    if args.output is None:
+        print(output)
+    else:
+        with open(args.output, 'w') as f:
+            f.write(output + '\n')
@@ -4,11 +4,44 @@ from .load_data import (
     load,
     load_all,
     load_fac,
+    load_fac_table,
     load_mpf,
+    iter_mpf,
     generate_config,
 )
 
 from .export_data import (
     export,
     export_mpf,
+    export_mpf_chunks,
+)
+
+from .cache import (
+    MpfCache,
+)
+
+from .fac import (
+    FacTable,
+)
+
+from .dataset import (
+    MpfDataset,
+)
+
+from .summary import (
+    summarize_mpf,
+)
+
+from .catalog import (
+    MpfCatalog,
+)
+
+from .diff import (
+    diff_mpf,
+)
+
+from .stats import (
+    MpfStats,
+    add_stats_hook,
+    remove_stats_hook,
 )
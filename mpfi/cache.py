@@ -0,0 +1,153 @@
+import os
+import hashlib
+import threading
+from pathlib import Path
+import numpy as np
+from .stats import stage
+
+CACHE_VERSION = '1' # bump when the parsed result of the same file may change
+
+def _hash(s):
+    return hashlib.sha1(s.encode('utf-8')).hexdigest()[:16]
+
+'''
+write df as a parquet or feather file, to a temporary file renamed to filename when done,
+so that a partially written file is never read
+metadata: extra {key: bytes} for the schema metadata
+'''
+def _write_table(df, filename, format, metadata={}, preserve_index=None):
+    # pyarrow is imported here so that it is only required when the cache / companions are used
+    import pyarrow as pa
+    table = pa.Table.from_pandas(df, preserve_index=preserve_index) # pandas dtypes are kept in the schema metadata
+    if metadata:
+        table = table.replace_schema_metadata({**(table.schema.metadata or {}), **metadata})
+    tmp = '{}.{}-{}.tmp'.format(filename, os.getpid(), threading.get_ident())
+    if format == 'parquet':
+        import pyarrow.parquet as pq
+        pq.write_table(table, tmp)
+    else:
+        import pyarrow.feather as feather
+        feather.write_feather(table, tmp)
+    os.replace(tmp, filename)
+
+def _read_schema(filename, format):
+    if format == 'parquet':
+        import pyarrow.parquet as pq
+        return pq.read_schema(filename)
+    import pyarrow.ipc as ipc
+    with ipc.open_file(filename) as reader:
+        return reader.schema
+
+'''
+Returns the pyarrow Table of a file written by _write_table
+columns: columns to be read (those not in the file are ignored), all if None
+'''
+def _read_table(filename, format, columns=None):
+    if columns is not None:
+        columns = [c for c in _read_schema(filename, format).names if c in columns]
+    if format == 'parquet':
+        import pyarrow.parquet as pq
+        return pq.read_table(filename, columns=columns)
+    import pyarrow.feather as feather
+    return feather.read_table(filename, columns=columns)
+
+'''
+DataFrame of a Table from _read_table, as read_csv gives it
+'''
+def _to_pandas(table):
+    df = table.to_pandas()
+    # missing text values are None from pyarrow, but NaN from read_csv
+    for c in df.columns[df.dtypes == object]:
+        if df[c].isna().any():
+            df[c] = df[c].where(df[c].notna(), np.nan)
+    return df
+
+'''
+Cache of parsed model point / .fac files stored as parquet (or feather) files, requires pyarrow
+
+folder: directory for the cache files, created if not exist
+max_bytes: total size cap of the cache folder, least recently used entries are evicted first
+format: 'parquet' or 'feather'
+
+A cache entry is keyed by the absolute path of the source file, its size and mtime,
+and the read_csv_options used for parsing. Changing the source file makes its entries stale.
+'''
+class MpfCache:
+    def __init__(self, folder, max_bytes=None, format='parquet'):
+        if format not in ['parquet', 'feather']:
+            raise ValueError('Unsupported cache format: {}'.format(format))
+        self.folder = Path(folder)
+        self.max_bytes = max_bytes
+        self.format = format
+        self.folder.mkdir(parents=True, exist_ok=True)
+
+    def _path_key(self, path):
+        return _hash(str(Path(path).resolve()))
+
+    def _entry(self, path, read_csv_options):
+        stat = os.stat(path)
+        fingerprint = _hash('{}|{}|{}'.format(CACHE_VERSION, stat.st_size, stat.st_mtime_ns))
+        options = _hash(repr(sorted(read_csv_options.items())))
+        return self._path_key(path), fingerprint, self.folder / '{}-{}-{}.{}'.format(
+            self._path_key(path), fingerprint, options, self.format,
+        )
+
+    def get(self, path, read_csv_options={}):
+        _, _, entry = self._entry(path, read_csv_options)
+        try:
+            df = _to_pandas(_read_table(entry, self.format))
+        except FileNotFoundError:
+            return None
+        try:
+            os.utime(entry) # mark as recently used
+        except FileNotFoundError:
+            pass
+        return df
+
+    def put(self, path, read_csv_options, df):
+        path_key, fingerprint, entry = self._entry(path, read_csv_options)
+        # entries of older versions of the same source file will never be hit again
+        for stale in self.folder.glob(path_key + '-*'):
+            if not stale.name.startswith('{}-{}-'.format(path_key, fingerprint)):
+                stale.unlink(missing_ok=True)
+        _write_table(df, entry, self.format)
+        self._evict()
+
+    '''
+    read the file with read_file(path) if it is not cached yet
+    '''
+    def load(self, read_file, path, read_csv_options={}):
+        with stage('cache_read', path) as s:
+            df = self.get(path, read_csv_options)
+            s.rows = None if df is None else len(df)
+        if df is not None:
+            return df
+        df = read_file(path)
+        with stage('cache_write', path, rows=len(df)):
+            self.put(path, read_csv_options, df)
+        return df
+
+    '''
+    remove the cache entries of path, or all entries if path is None
+    '''
+    def invalidate(self, path=None):
+        pattern = '*' if path is None else self._path_key(path) + '-*'
+        for entry in self.folder.glob(pattern):
+            entry.unlink(missing_ok=True)
+
+    def _evict(self):
+        if self.max_bytes is None:
+            return
+        entries = []
+        for entry in self.folder.glob('*.' + self.format):
+            try:
+                stat = entry.stat()
+            except FileNotFoundError:
+                continue
+            entries.append((stat.st_mtime_ns, stat.st_size, entry))
+        total = sum(size for _, size, _ in entries)
+        for _, size, entry in sorted(entries):
+            if total <= self.max_bytes:
+                break
+            entry.unlink(missing_ok=True)
+            total -= size
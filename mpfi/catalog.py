@@ -0,0 +1,198 @@
+import os
+import json
+from glob import escape
+from pathlib import Path
+import pandas as pd
+from .util import (
+    get_meta,
+    filter_columns,
+    get_variable_types,
+    merge_variable_types,
+    get_column_specs,
+    known_variable_types,
+)
+from .stats import logger
+from .load_data import (
+    _read_files,
+    _glob_files,
+    _scan_changes,
+    _header_variable_types,
+)
+
+CATALOG_FILENAME = '.mpfi-catalog.json'
+
+def _scan(path):
+    stat = os.stat(path)
+    meta = get_meta(path)
+    return {
+        'size': stat.st_size,
+        'mtime_ns': stat.st_mtime_ns,
+        'header_row': meta['header_row'],
+        'numlines': meta['numlines'],
+        'rows': meta['rows'],
+        'variable_names': meta['variable_names'],
+        'variable_types': get_variable_types(meta),
+    }
+
+'''
+Catalog of the model point files in a folder tree, with the header, VARIABLE_TYPES, NUMLINES,
+actual number of rows and size of each file, saved in .mpfi-catalog.json of the folder
+(or catalog_file) so that it can be queried without reading the files.
+
+folder: root folder of the model point files
+pattern: glob pattern of the files relative to folder, ** for any sub folders
+refresh() reads only the files added or changed (by size and modification time) since the last refresh.
+
+e.g.
+catalog = MpfCatalog('mpf/')
+catalog.refresh()
+catalog.files_with_columns(['SUM_ASSURED'])
+df = load_mpf('mpf/**/*.PRO', catalog=catalog, filter=[('CURRENCY', '==', 'USD')])
+'''
+class MpfCatalog:
+    def __init__(self, folder, pattern='**/*.PRO', catalog_file=None, workers=None):
+        self.folder = Path(folder).resolve()
+        self.pattern = pattern
+        self.catalog_file = Path(catalog_file) if catalog_file is not None else self.folder / CATALOG_FILENAME
+        self.workers = workers
+        self.entries = {} # path relative to folder (posix style): entry
+        if self.catalog_file.exists():
+            with open(self.catalog_file) as f:
+                self.entries = json.load(f)['files']
+
+    def _key(self, path):
+        return Path(path).resolve().relative_to(self.folder).as_posix()
+
+    '''
+    Returns the entry of path, None if path is not in the catalog
+    '''
+    def get(self, path):
+        try:
+            return self.entries.get(self._key(path))
+        except ValueError: # not under folder
+            return None
+
+    '''
+    Returns a dict of the paths (relative to folder) added, changed and deleted
+    '''
+    def refresh(self):
+        paths = {
+            self._key(p): p
+            for p in _glob_files(os.path.join(escape(str(self.folder)), self.pattern))
+            if p.resolve() != self.catalog_file.resolve()
+        }
+        current, added, changed, deleted = _scan_changes(paths, {
+            k: (entry['size'], entry['mtime_ns']) for k, entry in self.entries.items()
+        })
+        for k in deleted + changed:
+            del self.entries[k]
+        scanned = _read_files(
+            lambda k: (k, _scan(self.folder / k)),
+            sorted(added + changed),
+            self.workers,
+        )
+        for k, entry in scanned:
+            self.entries[k] = entry
+        self.save()
+        return {
+            'added': added,
+            'changed': changed,
+            'deleted': deleted,
+        }
+
+    def save(self):
+        tmp = self.catalog_file.with_name(self.catalog_file.name + '.tmp')
+        with open(tmp, 'w') as f:
+            json.dump({'folder': str(self.folder), 'files': self.entries}, f, indent=1, sort_keys=True)
+        os.replace(tmp, self.catalog_file)
+
+    '''
+    one row per file: path, size, numlines, rows, columns
+    '''
+    def to_frame(self):
+        return pd.DataFrame([
+            {
+                'path': k,
+                'size': entry['size'],
+                'numlines': entry['numlines'],
+                'rows': entry['rows'],
+                'columns': len(entry['variable_names']),
+            }
+            for k, entry in sorted(self.entries.items())
+        ], columns=['path', 'size', 'numlines', 'rows', 'columns'])
+
+    def files_with_columns(self, columns):
+        return [
+            k for k, entry in sorted(self.entries.items())
+            if all(c in entry['variable_names'] for c in columns)
+        ]
+
+    '''
+    files whose NUMLINES is different from the actual number of rows
+    '''
+    def numlines_mismatches(self):
+        return [
+            k for k, entry in sorted(self.entries.items())
+            if entry['numlines'] != -1 and entry['numlines'] != entry['rows']
+        ]
+
+    '''
+    Returns {column: {variable type: [files]}} for columns with different VARIABLE_TYPES across files
+    '''
+    def type_conflicts(self, files=None):
+        types = {}
+        for k in sorted(self.entries if files is None else files):
+            for column, variable_type in self.entries[k]['variable_types'].items():
+                types.setdefault(column, {}).setdefault(variable_type, []).append(k)
+        return {column: by_type for column, by_type in types.items() if len(by_type) > 1}
+
+    '''
+    VARIABLE_TYPES merged across files (see merge_variable_types), columns with incompatible (or unknown) types are left out
+    '''
+    def unified_types(self, files=None):
+        return merge_variable_types(
+            known_variable_types(self.entries[k]['variable_types']) for k in sorted(self.entries if files is None else files)
+        )
+
+    '''
+    read_csv dtype for loading the files, so that a column has the same dtype in all files
+    '''
+    def unified_dtypes(self, files=None):
+        return get_column_specs(self.unified_types(files))
+
+    '''
+    plan the loading of paths: files which cannot have rows selected by filter
+    (i.e. without the filter columns) are left out, and the unified dtypes of the remaining files are returned
+    Files not in the catalog, or changed (by size and modification time) since the last refresh,
+    are kept, and their headers are read for the dtypes.
+    unify_schema: False for no dtypes, i.e. only the files are planned
+    Returns (paths, dtype)
+    '''
+    def plan(self, paths, filter=None, unify_schema=True):
+        entries = {}
+        for path in paths:
+            entry = self.get(path)
+            if entry is not None:
+                entries[path] = entry
+        current, _, changed, _ = _scan_changes(
+            {path: path for path in entries},
+            {path: (entry['size'], entry['mtime_ns']) for path, entry in entries.items()},
+        )
+        stale = [path for path in entries if path not in current or path in changed]
+        if stale:
+            logger.info('%s files changed since the last refresh of the catalog are read without it', len(stale))
+        kept = []
+        variable_types_list = []
+        unknown = []
+        for path in paths:
+            if path in entries and path not in stale:
+                if not all(c in entries[path]['variable_names'] for c in filter_columns(filter)):
+                    continue
+                variable_types_list.append(known_variable_types(entries[path]['variable_types']))
+            else:
+                unknown.append(path)
+            kept.append(path)
+        if not unify_schema:
+            return kept, {}
+        variable_types_list += _header_variable_types(unknown)
+        return kept, get_column_specs(merge_variable_types(variable_types_list))
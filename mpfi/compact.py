@@ -0,0 +1,77 @@
+import importlib.util
+import numpy as np
+import pandas as pd
+from .constants import (
+    PROD_NAME_COLUMN,
+    EXTENSION_COLUMN,
+    VARIABLE_TYPES_ATTR,
+)
+
+# text columns with number of distinct values not more than this ratio of rows are stored as category
+CATEGORY_MAX_RATIO = 0.5
+
+def _string_dtype():
+    # pyarrow backed strings if available, otherwise keep python objects
+    if importlib.util.find_spec('pyarrow') is None:
+        return object
+    return pd.StringDtype('pyarrow')
+
+def _downcast_integer(series):
+    # N columns are kept as float64 to avoid losing precision, only I/S columns are downcast
+    if series.isna().all():
+        return series
+    lowest, highest = series.min(), series.max()
+    for dtype in [pd.Int8Dtype(), pd.Int16Dtype()]:
+        info = np.iinfo(dtype.numpy_dtype)
+        if info.min <= lowest and highest <= info.max:
+            return series.astype(dtype)
+    return series
+
+def _memory_usage(df):
+    return int(df.memory_usage(deep=True).sum())
+
+'''
+compact the dtypes of a DataFrame of a single model point file (as from _read_mpf)
+text columns are converted to category here, they are decided to be category or string in concat_compact
+Returns the compacted DataFrame and the memory usage (in bytes) before compaction
+'''
+def compact_frame(df):
+    memory_before = _memory_usage(df)
+    variable_types = df.attrs.get(VARIABLE_TYPES_ATTR, {})
+    columns = {}
+    for c in df.columns:
+        series = df[c]
+        if series.dtype == object:
+            columns[c] = series.astype('category')
+        elif variable_types.get(c, '')[:1] in ['I', 'S'] and pd.api.types.is_integer_dtype(series.dtype):
+            columns[c] = _downcast_integer(series)
+    return df.assign(**columns), memory_before
+
+'''
+concat DataFrames from compact_frame, with the categories of the same column unified
+so that pandas does not fall back to object dtype
+'''
+def concat_compact(dfs):
+    total_rows = sum(len(df) for df in dfs)
+    category_columns = []
+    for df in dfs:
+        category_columns.extend(
+            c for c in df.columns
+            if isinstance(df[c].dtype, pd.CategoricalDtype) and c not in category_columns
+        )
+    dfs = [df.copy(deep=False) for df in dfs]
+    for c in category_columns:
+        having = [df for df in dfs if c in df.columns and isinstance(df[c].dtype, pd.CategoricalDtype)]
+        categories = pd.api.types.union_categoricals([df[c] for df in having], ignore_order=True).categories
+        keep_category = c in [PROD_NAME_COLUMN, EXTENSION_COLUMN] or len(categories) <= CATEGORY_MAX_RATIO * total_rows
+        for df in dfs:
+            if c not in df.columns:
+                continue
+            if keep_category:
+                df[c] = df[c].astype(pd.CategoricalDtype(categories))
+            else:
+                df[c] = df[c].astype(_string_dtype())
+    return pd.concat(dfs, ignore_index=True)
+
+def read_compact(read_file, path):
+    return compact_frame(read_file(path))
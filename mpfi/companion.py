@@ -0,0 +1,70 @@
+import os
+import json
+from pathlib import Path
+from .cache import (
+    _write_table,
+    _read_table,
+    _read_schema,
+    _to_pandas,
+)
+
+'''
+Binary companion of a model point file, e.g. C123456.PRO.parquet next to C123456.PRO, written by export_mpf
+with the option companion='parquet' (or 'feather'), requires pyarrow.
+It is the text file as parsed by load_mpf (without read_csv_options), so that reading it gives the same DataFrame,
+with the VARIABLE_TYPES, and the size and mtime of the text file it is parsed from, in the schema metadata.
+load_mpf reads the companion instead of the text file only if the text file still has that size and mtime.
+'''
+COMPANION_FORMATS = ['parquet', 'feather']
+METADATA_KEY = b'mpfi_variable_types'
+SOURCE_KEY = b'mpfi_source'
+
+def companion_path(path, format):
+    return Path('{}.{}'.format(path, format))
+
+def _source(path):
+    stat = os.stat(path)
+    return {'size': stat.st_size, 'mtime_ns': stat.st_mtime_ns}
+
+'''
+the companion written from the current content of path (i.e. same size and mtime), None if not found
+'''
+def find_companion(path):
+    try:
+        source = _source(path)
+    except FileNotFoundError:
+        return None
+    for format in COMPANION_FORMATS:
+        candidate = companion_path(path, format)
+        # checked first so that pyarrow is not required without companions
+        if not os.path.isfile(candidate):
+            continue
+        try:
+            metadata = _read_schema(candidate, format).metadata or {}
+        except FileNotFoundError:
+            continue
+        if SOURCE_KEY in metadata and json.loads(metadata[SOURCE_KEY]) == source:
+            return candidate, format
+    return None
+
+'''
+write the companion of the text file path
+df / variable_types: the parsed text file and its VARIABLE_TYPES
+Returns the companion path
+'''
+def write_companion(path, df, variable_types, format):
+    filename = companion_path(path, format)
+    _write_table(df, filename, format, {
+        METADATA_KEY: json.dumps(variable_types).encode('utf-8'),
+        SOURCE_KEY: json.dumps(_source(path)).encode('utf-8'),
+    }, preserve_index=False)
+    return filename
+
+'''
+columns: columns to be read, all if None
+Returns the DataFrame and the VARIABLE_TYPES of the text file
+'''
+def read_companion(filename, format, columns=None):
+    table = _read_table(filename, format, columns)
+    variable_types = json.loads(table.schema.metadata[METADATA_KEY])
+    return _to_pandas(table), variable_types
@@ -1,2 +1,4 @@
 PROD_NAME_COLUMN = '_PROD_NAME'
 EXTENSION_COLUMN = '_EXTENSION' # including the dot
+# key of DataFrame.attrs storing the VARIABLE_TYPES of the loaded model point files, e.g. {'PLAN_CODE': 'T6'}
+VARIABLE_TYPES_ATTR = 'mpfi_variable_types'
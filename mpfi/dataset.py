@@ -0,0 +1,95 @@
+from functools import partial
+import pandas as pd
+from .compact import (
+    read_compact,
+)
+from .load_data import (
+    _mpf_reader,
+    _read_files,
+    _concat_mpf,
+    _glob_files,
+    _scan_changes,
+    _schema_options,
+)
+
+def _read_tagged(read_file, compact, path):
+    df = read_file(path)
+    if compact:
+        df, _ = df
+    return path, df
+
+'''
+Model point files of file_pattern loaded into one DataFrame (data), which can be refreshed
+by parsing only the files added or changed (by size and modification time) since the last refresh.
+
+The other arguments are the same as load_mpf (except catalog). With cache (an MpfCache), the parsed files are also kept
+on disk, so that a new MpfDataset of the same files does not parse the unchanged files again.
+With unify_schema, the dtypes are unified across all the current files on each refresh, and the unchanged
+files are also read again if the unified dtypes are changed (e.g. a column changed from I to N in a new file).
+
+e.g.
+dataset = MpfDataset('mpf/*.PRO', workers=8)
+dataset.data # the combined DataFrame
+dataset.refresh() # after some files are regenerated
+'''
+class MpfDataset:
+    def __init__(self, file_pattern, read_csv_options={}, columns=None, filter=None, workers=None, executor=None, cache=None,
+                 compact=False, unify_schema=True, companion=True):
+        self.file_pattern = file_pattern
+        self.read_csv_options = read_csv_options
+        self.columns = columns
+        self.filter = filter
+        self.workers = workers
+        self.executor = executor
+        self.cache = cache
+        self.compact = compact
+        self.unify_schema = unify_schema
+        self.companion = companion
+        self._options = None # read_csv_options of the loaded partitions
+        self.fingerprints = {} # path: (size, mtime)
+        self.partitions = {} # path: DataFrame of the file
+        self.data = pd.DataFrame()
+        self.refresh()
+
+    '''
+    Returns a dict of the paths added, changed and deleted
+    '''
+    def refresh(self):
+        current, added, changed, deleted = _scan_changes(
+            {p: p for p in _glob_files(self.file_pattern)},
+            self.fingerprints,
+        )
+        options = _schema_options(sorted(current), self.read_csv_options, self.unify_schema)
+        reread = []
+        if options != self._options:
+            # the unified dtypes are changed, so the unchanged files are read again with the same dtypes
+            reread = [p for p in self.fingerprints if p in current and p not in changed]
+            self._options = options
+        read_file = _mpf_reader(options, self.cache, self.columns, self.filter, self.companion)
+        if self.compact:
+            read_file = partial(read_compact, read_file)
+
+        for p in deleted + changed + reread:
+            self.fingerprints.pop(p)
+            self.partitions.pop(p)
+        results = _read_files(
+            partial(_read_tagged, read_file, self.compact),
+            sorted(added + changed + reread),
+            self.workers,
+            self.executor,
+        )
+        for p, df in results:
+            # files failed to load are not recorded, and will be read again in the next refresh
+            self.fingerprints[p] = current[p]
+            self.partitions[p] = df
+
+        if len(added) + len(changed) + len(deleted) + len(reread) > 0:
+            if len(self.partitions) == 0:
+                self.data = pd.DataFrame()
+            else:
+                self.data = _concat_mpf([self.partitions[p] for p in sorted(self.partitions)], self.compact)
+        return {
+            'added': added,
+            'changed': changed,
+            'deleted': deleted,
+        }
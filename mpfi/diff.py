@@ -0,0 +1,156 @@
+from functools import partial
+import numpy as np
+import pandas as pd
+from .constants import (
+    PROD_NAME_COLUMN,
+    EXTENSION_COLUMN,
+)
+from .util import align_frames
+from .stats import logger, stage
+from .load_data import (
+    _read_mpf,
+    _read_files,
+    _glob_files,
+    _unified_dtypes,
+    _concat_mpf,
+)
+
+def _load_files(files, read_csv_options, columns, filter):
+    if len(files) == 0:
+        return None
+    return _concat_mpf([_read_mpf(f, read_csv_options, columns, filter) for f in files])
+
+def _hash(df):
+    return pd.util.hash_pandas_object(df, index=False).to_numpy()
+
+def _unique_keys(df, keys, name):
+    # 64 bit hash of the key columns, rows with a duplicated key after the first are dropped
+    key_hash = _hash(df[keys])
+    duplicated = pd.Index(key_hash).duplicated()
+    if duplicated.any():
+        logger.warning('%s rows with duplicated keys dropped in %s', duplicated.sum(), name)
+        df = df[~duplicated].reset_index(drop=True)
+        key_hash = key_hash[~duplicated]
+    return df, key_hash
+
+def _compare_columns(old, new, keys, columns):
+    if columns is not None:
+        return [c for c in columns if c not in keys]
+    return [
+        c for c in new.columns
+        if c in old.columns and c not in keys and c[0] not in ('!', '&', '_')
+    ]
+
+def _diff_group(group, keys, columns, read_csv_options, filter, values):
+    name, old_files, new_files = group
+    # both sides are parsed into the same dtypes, so that equal values have equal hashes
+    options = {
+        **read_csv_options,
+        'dtype': _unified_dtypes(old_files + new_files) | read_csv_options.get('dtype', {}),
+    }
+    read_columns = None if columns is None else list(dict.fromkeys(
+        [c for c in keys + columns if c not in [PROD_NAME_COLUMN, EXTENSION_COLUMN]]
+    ))
+    old = _load_files(old_files, options, read_columns, filter)
+    new = _load_files(new_files, options, read_columns, filter)
+    if old is None or new is None:
+        return {
+            'new': new,
+            'exited': old,
+            'changed': None,
+        }
+
+    with stage('compare', name, rows=len(old) + len(new)):
+        old, old_hash = _unique_keys(old, keys, name)
+        new, new_hash = _unique_keys(new, keys, name)
+        # position in old of each new row, -1 if the key is new
+        positions = pd.Index(old_hash).get_indexer(new_hash)
+        matched = positions >= 0
+        exited = np.ones(len(old), dtype=bool)
+        exited[positions[matched]] = False
+
+        compare = _compare_columns(old, new, keys, columns)
+        old_rows = positions[matched]
+        new_rows = np.flatnonzero(matched)
+        # row digests first, so that only the rows with any change are compared column by column
+        if len(compare) == 0:
+            digest_changed = np.zeros(len(new_rows), dtype=bool)
+        else:
+            digest_changed = _hash(old[compare].iloc[old_rows]) != _hash(new[compare].iloc[new_rows])
+        old_rows = old_rows[digest_changed]
+        new_rows = new_rows[digest_changed]
+
+        old_changed = old.iloc[old_rows]
+        new_changed = new.iloc[new_rows]
+        changed = new_changed[keys].reset_index(drop=True)
+        for c in compare:
+            changed[c + '_CHANGED'] = _hash(old_changed[c]) != _hash(new_changed[c])
+        if values:
+            for c in compare:
+                changed[c + '_OLD'] = old_changed[c].to_numpy()
+                changed[c + '_NEW'] = new_changed[c].to_numpy()
+    return {
+        'new': new[~matched],
+        'exited': old[exited],
+        'changed': changed,
+    }
+
+def _concat_results(results, kind):
+    dfs = [r[kind] for r in results if r[kind] is not None]
+    if len(dfs) == 0:
+        return pd.DataFrame()
+    if kind == 'changed':
+        return pd.concat(align_frames(dfs), ignore_index=True)
+    return _concat_mpf(dfs)
+
+'''
+Differences between two sets of model point files, e.g. last month's and this month's
+old_pattern / new_pattern: glob patterns of the model point files, ** for any sub folders
+keys: columns identifying a policy, e.g. ['_PROD_NAME', 'SPCODE', 'POLICY_NUMBER']
+columns: columns compared, all columns in both old and new if not given
+values: also return the old and new values of the compared columns for the changed policies
+filter / read_csv_options: same as load_mpf, applied to both old and new
+workers / executor: for comparing the products in parallel, same as load_mpf
+
+Policies are matched by a 64 bit hash of the keys, and the compared columns of matched policies
+are checked with a hash of each row first, so that only changed rows are compared column by column.
+With _PROD_NAME in keys, the files are compared product by product, i.e. only the files of one product
+(of both old and new) are in memory at a time. Rows with a duplicated key after the first are reported and dropped.
+A file failed to read raises the error (unlike load_mpf), instead of its policies being left out of the result.
+
+Returns a dict of DataFrames:
+new: rows of new with keys not in old
+exited: rows of old with keys not in new
+changed: keys of the policies in both old and new with any compared column changed,
+    with a <column>_CHANGED flag for each compared column (and <column>_OLD, <column>_NEW with values)
+
+e.g.
+diff = diff_mpf('mpf_202312/*.PRO', 'mpf_202401/*.PRO', keys=['_PROD_NAME', 'SPCODE', 'POLICY_NUMBER'], columns=['SUM_ASSURED', 'ANNUAL_PREM'])
+diff['changed']['SUM_ASSURED_CHANGED'].sum()
+'''
+def diff_mpf(old_pattern, new_pattern, keys, columns=None, values=False, read_csv_options={}, filter=None, workers=None, executor=None):
+    old_files = _glob_files(old_pattern)
+    new_files = _glob_files(new_pattern)
+    if PROD_NAME_COLUMN in keys:
+        names = sorted({p.stem for p in old_files + new_files})
+        groups = [
+            (name, [p for p in old_files if p.stem == name], [p for p in new_files if p.stem == name])
+            for name in names
+        ]
+    else:
+        groups = [('all files', old_files, new_files)]
+    results = _read_files(
+        partial(
+            _diff_group,
+            keys=keys,
+            columns=columns,
+            read_csv_options=read_csv_options,
+            filter=filter,
+            values=values,
+        ),
+        groups,
+        workers,
+        executor,
+        raise_errors=True,
+    )
+    return {kind: _concat_results(results, kind) for kind in ['new', 'exited', 'changed']}
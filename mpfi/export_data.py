@@ -1,21 +1,64 @@
 import os
 import re
 import csv
+import json
+import shutil
+import hashlib
+from concurrent.futures import ThreadPoolExecutor
 from pathlib import Path
 import pandas as pd
 import numpy as np
 from .constants import (
     PROD_NAME_COLUMN,
     EXTENSION_COLUMN,
+    VARIABLE_TYPES_ATTR,
+)
+from .util import (
+    merge_prophet_type,
+    get_variable_types,
+)
+from .companion import (
+    COMPANION_FORMATS,
+    find_companion,
+    write_companion,
 )
 from .load_data import (
     _load_config,
+    _warn_deprecated,
+    _parse_mpf,
+)
+from .stats import (
+    logger,
+    stage,
 )
 
 def _remove_asterisk_quotes(s):
     # replace "*" by * for start of data lines in MPF
     return re.sub(r'^"\*"', '*', s, flags=re.M)
 
+'''
+write the data lines of rows to f, chunksize rows at a time
+positions: positions of the rows to be written in this order (see _plan_export), all rows if None
+    only chunksize rows are copied at a time
+the leading * (first column of MPF) is written without quotes
+'''
+def _write_mpf_rows(f, rows, to_csv_opt, chunksize, positions=None):
+    columns = to_csv_opt['columns']
+    first_column = columns[0]
+    for start in range(0, len(rows) if positions is None else len(positions), chunksize):
+        if positions is None:
+            chunk = rows.iloc[start:start + chunksize]
+        else:
+            chunk = rows.take(positions[start:start + chunksize])
+        if len(columns) > 1 and (chunk[first_column] == '*').all():
+            # write the other columns and prefix each line with *, instead of removing the quotes afterwards
+            lines = chunk.to_csv(**{**to_csv_opt, 'columns': columns[1:]})
+            # only if no value contains a newline, i.e. one line per row
+            if lines.count('\n') == len(chunk):
+                f.write('*,' + lines[:-1].replace('\n', '\n*,') + '\n')
+                continue
+        f.write(_remove_asterisk_quotes(chunk.to_csv(**to_csv_opt)))
+
 def _get_mpf_columns(df, opt, config):
     columns = [
         c for c in list(df.columns)
@@ -27,26 +70,84 @@ def _get_mpf_columns(df, opt, config):
     columns = [c for c in columns if c not in opt['exclude_columns']]
     return columns
 
-def _to_prophet_type(dtype, series, date_format):
+'''
+maximum length of the strings in series, computed on the distinct values (or the categories) only
+non-string values (e.g. NaN) count as length 1
+'''
+def _string_width(series):
+    if isinstance(series.dtype, pd.CategoricalDtype):
+        values = series.cat.categories
+        has_other = (series.cat.codes.to_numpy() == -1).any()
+    else:
+        values = series.unique()
+        has_other = False
+    lengths = [len(v) for v in values if isinstance(v, str)]
+    has_other = has_other or len(lengths) < len(values)
+    return max(lengths + [1 if has_other or len(lengths) == 0 else 0])
+
+def _to_prophet_letter(dtype):
     dtype_str = str(dtype).lower()
     if dtype_str in ['int16']:
         return 'S'
-    if dtype_str in ['int', 'int32', 'int64']:
+    if dtype_str in ['int', 'int8', 'int32', 'int64']:
         return 'I'
     if dtype_str in ['float', 'float64']:
         return 'N'
-    if dtype_str in ['str', 'string', 'category', 'object']:
-        length = int(series.str.len().astype(pd.Int64Dtype()).fillna(1).max())
-        return f'T{length}'
+    if dtype_str in ['str', 'string', 'category', 'object'] or dtype_str.startswith('string['):
+        return 'T'
     if dtype_str in ['datetime64[ns]']:
+        return 'D'
+    return None
+
+def _to_prophet_type(dtype, series, date_format):
+    letter = _to_prophet_letter(dtype)
+    if letter is None:
+        raise Exception('Unhandled dtype: {}, type is {}'.format(dtype, type(dtype)))
+    if letter == 'T':
+        return f'T{_string_width(series)}'
+    if letter == 'D':
         return f'D{date_format}'
-    raise Exception('Unhandled dtype: {}, type is {}'.format(dtype, type(dtype)))
+    return letter
 
-def _get_column_types(df, column_names, date_format):
-    return [_to_prophet_type(df[c].dtype, df[c], date_format) for c in column_names]
+'''
+column_types: None to infer from the data,
+    'loaded' to reuse the T widths and I/S types in VARIABLE_TYPES of the model point files the DataFrame
+    was loaded from (see load_mpf), the widths are not checked against the data
+    or a dict of {column: type} (e.g. {'PLAN_CODE': 'T6'}) to skip inference of these columns
+Columns not covered by column_types are inferred from the data,
+except that integer columns keep the I/S type they were loaded with (e.g. when downcast by load_mpf with compact=True).
+'''
+def _get_column_types(df, column_names, date_format, column_types=None):
+    loaded = df.attrs.get(VARIABLE_TYPES_ATTR, {})
+    if column_types == 'loaded':
+        column_types = {
+            c: loaded[c] for c in column_names
+            # other types are cheap to infer, and may have been changed after loading
+            if c in loaded and (
+                (loaded[c][0] == 'T' and _to_prophet_letter(df[c].dtype) == 'T')
+                or (loaded[c] in ['I', 'S'] and _to_prophet_letter(df[c].dtype) in ['I', 'S'])
+            )
+        }
+    column_types = column_types or {}
+    result = []
+    for c in column_names:
+        if c in column_types:
+            result.append(column_types[c])
+            continue
+        variable_type = _to_prophet_type(df[c].dtype, df[c], date_format)
+        # the loaded I/S type is kept if the dtype fits, e.g. when downcast by load_mpf with compact=True
+        if variable_type in ['I', 'S'] and loaded.get(c) in ['I', 'S'] and (
+            loaded[c] == 'I' or str(df[c].dtype).lower() in ['int8', 'int16']
+        ):
+            variable_type = loaded[c]
+        result.append(variable_type)
+    return result
 
-def export(data, folder, options={}, to_csv_options={}):
-    print('Warning: this function will be deprecated in the next release. Please switch to `export_mpf` instead.')
+'''
+config: a config dict instead of mpfi-config.py, same as load_all
+'''
+def export(data, folder, options={}, to_csv_options={}, config=None):
+    _warn_deprecated('export_mpf')
     default_options = {
         'split_into_prod': True,
         'write_header': True,
@@ -55,7 +156,7 @@ def export(data, folder, options={}, to_csv_options={}):
         'output_format': 'mpfi',
     }
     opt = {**default_options, **options}
-    config = _load_config()
+    config = _load_config(config)
     df = data.reset_index()
     mpf_columns = _get_mpf_columns(df, opt, config)
 
@@ -110,6 +211,168 @@ def export(data, folder, options={}, to_csv_options={}):
         **to_csv_opt,
     )
 
+'''
+overwrite: 'ask' to confirm by input(), 'always' to overwrite without asking, 'never' to abort if the folder exists
+Returns whether the export should proceed.
+'''
+def _prepare_folder(folder, overwrite):
+    if overwrite not in ['ask', 'always', 'never']:
+        raise ValueError('Unsupported overwrite option: {}'.format(overwrite))
+    try_folder = Path(folder)
+    if not try_folder.exists():
+        os.mkdir(folder)
+        return True
+    if overwrite == 'always':
+        return True
+    if overwrite == 'never':
+        logger.warning('Aborted. Folder "%s" already existed.', folder)
+        return False
+    response = input('Warning: folder "{}" already existed. Confirm overwrite? (y/n) '.format(folder))
+    return response == 'Y' or response == 'y'
+
+# {file name: {'digest', 'size', 'mtime_ns'}} of the exported files, for the incremental option
+MANIFEST_FILENAME = '.mpfi-manifest.json'
+
+def _read_manifest(folder):
+    try:
+        with open('{}/{}'.format(folder, MANIFEST_FILENAME)) as f:
+            return json.load(f)
+    except FileNotFoundError:
+        return {}
+
+def _write_manifest(folder, manifest):
+    filename = '{}/{}'.format(folder, MANIFEST_FILENAME)
+    with open(filename + '.tmp', 'w') as f:
+        json.dump(manifest, f, indent=1, sort_keys=True)
+    os.replace(filename + '.tmp', filename)
+
+'''
+remove the entries of names (files written without the incremental option) from the manifest of folder, if any
+'''
+def _forget_manifest_entries(folder, names):
+    manifest = _read_manifest(folder)
+    if any(name in manifest for name in names):
+        _write_manifest(folder, {k: v for k, v in manifest.items() if k not in names})
+
+def _manifest_entry(filename, digest):
+    stat = os.stat(filename)
+    return {'digest': digest, 'size': stat.st_size, 'mtime_ns': stat.st_mtime_ns}
+
+'''
+whether filename is still the file written with the manifest entry previous, and has the same digest
+'''
+def _is_unchanged(filename, digest, previous):
+    if not isinstance(previous, dict) or previous.get('digest') != digest:
+        return False
+    try:
+        stat = os.stat(filename)
+    except FileNotFoundError:
+        return False
+    return stat.st_size == previous['size'] and stat.st_mtime_ns == previous['mtime_ns']
+
+'''
+digest of the content of an exported file: the header options and the (sorted) rows
+computed on the values without converting them to text
+'''
+def _rows_digest(rows, positions, column_types, to_csv_opt, opt):
+    h = hashlib.sha1()
+    h.update(repr((opt['output_format'], column_types, sorted(to_csv_opt.items()))).encode('utf-8'))
+    # the row hashes are independent, so hashing chunk by chunk gives the same digest as all rows at once
+    for start in range(0, len(positions), opt['chunksize']):
+        chunk = rows.take(positions[start:start + opt['chunksize']])
+        h.update(pd.util.hash_pandas_object(chunk[to_csv_opt['columns']], index=False).to_numpy().tobytes())
+    return h.hexdigest()
+
+def _write_mpf_file(filename, rows, positions, column_types, to_csv_opt, opt):
+    with stage('write', filename, rows=len(positions)) as s:
+        with open(filename, 'w', newline='\r\n') as f:
+            f.write(f'OUTPUT_FORMAT, {opt["output_format"]}\n')
+            f.write(f'NUMLINES, {len(positions)}\n')
+            f.write('VARIABLE_TYPES,' + ','.join(column_types) + '\n')
+            f.write(','.join(to_csv_opt['columns']) + '\n')
+            _write_mpf_rows(f, rows, to_csv_opt, opt['chunksize'], positions)
+            f.write('\n')
+        s.bytes = os.path.getsize(filename)
+
+'''
+write the binary companion of a product file (see companion.py) with opt['companion'] as the format,
+from the text file as written, so that the companion loads the same as the text file
+'''
+def _write_mpf_companion(filename, opt):
+    if opt['companion'] is None:
+        return
+    df, meta, _ = _parse_mpf(Path(filename))
+    with stage('write_companion', filename, rows=len(df)) as s:
+        companion = write_companion(filename, df, get_variable_types(meta), opt['companion'])
+        s.bytes = os.path.getsize(companion)
+
+'''
+export plan: positions of the rows in the order they are written, i.e. sorted (stably) by _PROD_NAME, _EXTENSION
+and sort_by with missing values last, and (prod_name, extension, start, end) of each file in the positions
+It is one argsort over the whole frame instead of copying and sorting each product.
+Rows without _PROD_NAME or _EXTENSION are not exported.
+'''
+def _plan_export(df, sort_by):
+    prod_codes, prod_names = pd.factorize(df[PROD_NAME_COLUMN], sort=True)
+    extension_codes, extensions = pd.factorize(df[EXTENSION_COLUMN], sort=True)
+    sort_codes = []
+    for c in sort_by:
+        codes, values = pd.factorize(df[c], sort=True)
+        codes[codes == -1] = len(values)
+        sort_codes.append(codes)
+    # the last key is the primary key of lexsort, which is stable
+    positions = np.lexsort(sort_codes[::-1] + [extension_codes, prod_codes])
+    positions = positions[(prod_codes[positions] != -1) & (extension_codes[positions] != -1)]
+    file_codes = prod_codes[positions].astype(np.int64) * len(extensions) + extension_codes[positions]
+    starts = np.flatnonzero(np.diff(file_codes, prepend=-1))
+    ends = np.append(starts[1:], len(positions))
+    return positions, [
+        (prod_names[prod_codes[positions[start]]], extensions[extension_codes[positions[start]]], start, end)
+        for start, end in zip(starts, ends)
+    ]
+
+'''
+write one product file, with the rows of positions (see _plan_export)
+with opt['incremental'], the file is skipped if the digest is the same as previous (the entry in the manifest)
+and the file on disk is still the one written then (same size and mtime), otherwise written to a temporary file and renamed
+Returns the manifest entry (None if not incremental) and whether the file is written
+'''
+def _export_mpf_file(filename, rows, positions, column_types, to_csv_opt, opt, previous=None):
+    if not opt['incremental']:
+        _write_mpf_file(filename, rows, positions, column_types, to_csv_opt, opt)
+        _write_mpf_companion(filename, opt)
+        return None, True
+    with stage('digest', filename, rows=len(positions)):
+        digest = _rows_digest(rows, positions, column_types, to_csv_opt, opt)
+    if _is_unchanged(filename, digest, previous):
+        if opt['companion'] is None or find_companion(filename) is not None:
+            return previous, False
+        # unchanged, but the companion is missing (e.g. the option is newly added)
+        _write_mpf_companion(filename, opt)
+        return previous, True
+    _write_mpf_file(filename + '.tmp', rows, positions, column_types, to_csv_opt, opt)
+    os.replace(filename + '.tmp', filename)
+    entry = _manifest_entry(filename, digest)
+    _write_mpf_companion(filename, opt)
+    return entry, True
+
+'''
+options:
+    column_types: None (default) to infer VARIABLE_TYPES from the data, 'loaded' to reuse T widths and I/S types from load_mpf,
+        or {column: type} to skip inference, e.g. {'POLICY_NUMBER': 'T8'}
+    workers: number of threads for writing the product files in parallel
+    executor: alternatively a concurrent.futures.Executor, e.g. ProcessPoolExecutor
+    overwrite: 'ask' (default), 'always' or 'never', when the folder already exists
+    incremental: only rewrite the product files whose content changed since the last incremental export,
+        according to the digests kept in .mpfi-manifest.json of the folder. Files are replaced atomically.
+        A file modified since (e.g. by another export to the folder) is written again.
+    companion: None (default), 'parquet' or 'feather' to also write a binary companion of each product file
+        (e.g. C123456.PRO.parquet, requires pyarrow), i.e. the text file as parsed by load_mpf, with VARIABLE_TYPES
+        and the size and mtime of the text file in its metadata. load_mpf reads the companion instead of the text file
+        while the text file is not changed since.
+    sort_by: columns to sort the rows of each file by (stable, missing values last), [] to keep the order of df,
+        None (default) for SPCODE if the column exists
+'''
 def export_mpf(df, folder, options={}, to_csv_options={}):
     if folder[-1] in '/\\':
         folder = folder[:-1]
@@ -118,10 +381,24 @@ def export_mpf(df, folder, options={}, to_csv_options={}):
         'include_columns': [],
         'exclude_columns': [],
         'output_format': 'mpfi',
+        'chunksize': 100000, # number of rows converted to text at a time
+        'workers': None,
+        'executor': None,
+        'overwrite': 'ask',
+        'column_types': None, # None, 'loaded' or {column: type}, see _get_column_types
+        'incremental': False,
+        'companion': None,
+        'sort_by': None, # None for SPCODE if exists
     }
     opt = {**default_options, **options}
-    df = df.reset_index()
+    if opt['companion'] is not None and opt['companion'] not in COMPANION_FORMATS:
+        raise ValueError('Unsupported companion format: {}'.format(opt['companion']))
+    if any(name is not None for name in df.index.names):
+        df = df.reset_index() # an unnamed index is not exported, no need to copy the frame
     mpf_columns = _get_mpf_columns(df, opt, {'PROD_NAME_COLUMN': PROD_NAME_COLUMN})
+    sort_by = opt['sort_by']
+    if sort_by is None:
+        sort_by = ['SPCODE'] if 'SPCODE' in df.columns else []
 
     to_csv_opt = {
         'index': False,
@@ -133,27 +410,129 @@ def export_mpf(df, folder, options={}, to_csv_options={}):
         **to_csv_options,
     }
 
-    column_types = _get_column_types(df, mpf_columns, to_csv_opt['date_format'])
+    with stage('infer_types', rows=len(df)):
+        column_types = _get_column_types(df, mpf_columns, to_csv_opt['date_format'], opt['column_types'])
 
-    try_folder = Path(folder)
-    if try_folder.exists():
-        response = input('Warning: folder "{}" already existed. Confirm overwrite? (y/n) '.format(folder))
-        if not (response == 'Y' or response == 'y'):
-            return
+    if not _prepare_folder(folder, opt['overwrite']):
+        return
+    with stage('plan', rows=len(df)):
+        positions, files = _plan_export(df, sort_by)
+    file_opt = {k: opt[k] for k in ['chunksize', 'output_format', 'incremental', 'companion']}
+    manifest = _read_manifest(folder) if opt['incremental'] else {}
+    tasks = []
+    for prod_name, extension, start, end in files:
+        if opt['executor'] is None:
+            # threads share the frame, and read the rows of the file from the slice of positions
+            rows, file_positions = df, positions[start:end]
+        else:
+            # only the rows of the file are sent to the executor
+            rows, file_positions = df.take(positions[start:end]), np.arange(end - start)
+        tasks.append((
+            '{}{}'.format(prod_name, extension),
+            ('{}/{}{}'.format(folder, prod_name, extension), rows, file_positions, column_types, to_csv_opt, file_opt),
+        ))
+
+    if opt['executor'] is None and (opt['workers'] is None or opt['workers'] <= 1):
+        results = [_export_mpf_file(*args, manifest.get(name)) for name, args in tasks]
     else:
-        os.mkdir(folder)
-    for (prod_name, extension), rows in df.groupby([PROD_NAME_COLUMN, EXTENSION_COLUMN]):
-        out_lines = []
-        out_lines.append(f'OUTPUT_FORMAT, {opt["output_format"]}')
-        out_lines.append(f'NUMLINES, {len(rows)}')
-        out_lines.append('VARIABLE_TYPES,' + ','.join(column_types))
-        out_lines.append(','.join(mpf_columns))
-        data_lines = _remove_asterisk_quotes(
-            rows.sort_values(['SPCODE'], kind='mergesort').to_csv(**to_csv_opt)
-        )
-        out_lines.append(data_lines)
-
-        filename = '{}/{}{}'.format(folder, prod_name, extension)
-        with open(filename, 'w', newline='\r\n') as f:
-            for l in out_lines:
-                f.write(l + '\n')
+        def write_all(executor):
+            futures = [executor.submit(_export_mpf_file, *args, manifest.get(name)) for name, args in tasks]
+            return [future.result() for future in futures] # raise the error if any
+
+        if opt['executor'] is not None:
+            results = write_all(opt['executor'])
+        else:
+            with ThreadPoolExecutor(max_workers=opt['workers']) as executor:
+                results = write_all(executor)
+
+    if opt['incremental']:
+        written = sum(1 for _, is_written in results if is_written)
+        logger.info('%s of %s files written, others unchanged.', written, len(tasks))
+        _write_manifest(folder, {**manifest, **{name: entry for (name, _), (entry, _) in zip(tasks, results)}})
+    else:
+        _forget_manifest_entries(folder, [name for name, _ in tasks])
+
+def _merge_prophet_types(types, other_types):
+    if types is None:
+        return other_types
+    merged = [merge_prophet_type(a, b) for a, b in zip(types, other_types)]
+    for a, b, m in zip(types, other_types, merged):
+        if m is None:
+            raise Exception('Column types not matched across chunks: {} and {}'.format(a, b))
+    return merged
+
+'''
+Same as export_mpf, but takes an iterable of DataFrames (e.g. from iter_mpf) so that
+the whole data is never held in memory. Rows of each product are written in the order received,
+i.e. not sorted by SPCODE. All chunks must have the same columns.
+Data lines are written to a temporary file per product first, the header (NUMLINES, VARIABLE_TYPES)
+is written when all chunks are consumed.
+'''
+def export_mpf_chunks(chunks, folder, options={}, to_csv_options={}):
+    if folder[-1] in '/\\':
+        folder = folder[:-1]
+    default_options = {
+        'include_columns': [],
+        'exclude_columns': [],
+        'output_format': 'mpfi',
+        'chunksize': 100000,
+        'overwrite': 'ask',
+        'column_types': None,
+    }
+    opt = {**default_options, **options, 'split_into_prod': True}
+
+    if not _prepare_folder(folder, opt['overwrite']):
+        return
+
+    parts = {}
+    try:
+        for chunk in chunks:
+            chunk = chunk.reset_index()
+            mpf_columns = _get_mpf_columns(chunk, opt, {'PROD_NAME_COLUMN': PROD_NAME_COLUMN})
+            to_csv_opt = {
+                'index': False,
+                'columns': mpf_columns,
+                'lineterminator': '\n',
+                'header': False,
+                'quoting': csv.QUOTE_NONNUMERIC,
+                'date_format': '%m/%d/%Y',
+                **to_csv_options,
+            }
+            for (prod_name, extension), rows in chunk.groupby([PROD_NAME_COLUMN, EXTENSION_COLUMN], sort=False, observed=True):
+                key = (prod_name, extension)
+                if key not in parts:
+                    data_filename = '{}/.{}{}.data.tmp'.format(folder, prod_name, extension)
+                    parts[key] = {
+                        'data_filename': data_filename,
+                        'file': open(data_filename, 'w', newline='\r\n'),
+                        'columns': mpf_columns,
+                        'column_types': None,
+                        'rows': 0,
+                    }
+                part = parts[key]
+                if part['columns'] != mpf_columns:
+                    raise Exception('Columns not matched across chunks for {}{}'.format(prod_name, extension))
+                part['column_types'] = _merge_prophet_types(
+                    part['column_types'],
+                    _get_column_types(rows, mpf_columns, to_csv_opt['date_format'], opt['column_types']),
+                )
+                part['rows'] += len(rows)
+                with stage('write', part['data_filename'], rows=len(rows)):
+                    _write_mpf_rows(part['file'], rows, to_csv_opt, opt['chunksize'])
+
+        for (prod_name, extension), part in parts.items():
+            part['file'].close()
+            filename = '{}/{}{}'.format(folder, prod_name, extension)
+            with open(filename, 'w', newline='\r\n') as f:
+                f.write(f'OUTPUT_FORMAT, {opt["output_format"]}\n')
+                f.write(f'NUMLINES, {part["rows"]}\n')
+                f.write('VARIABLE_TYPES,' + ','.join(part['column_types']) + '\n')
+                f.write(','.join(part['columns']) + '\n')
+            with open(filename, 'ab') as f, open(part['data_filename'], 'rb') as data:
+                shutil.copyfileobj(data, f)
+                f.write(b'\r\n')
+        _forget_manifest_entries(folder, ['{}{}'.format(prod_name, extension) for prod_name, extension in parts])
+    finally:
+        for part in parts.values():
+            part['file'].close()
+            Path(part['data_filename']).unlink(missing_ok=True)
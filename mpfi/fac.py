@@ -0,0 +1,88 @@
+import numpy as np
+import pandas as pd
+from .stats import logger
+
+'''
+A .fac table (as from load_fac) with a hashed index on its key columns, for looking up many keys at once
+
+data: DataFrame indexed by the key columns, e.g. from load_fac
+'''
+class FacTable:
+    def __init__(self, data):
+        if not data.index.is_unique:
+            logger.warning('duplicated keys found in the table, only the first row of each key is used')
+            data = data[~data.index.duplicated()]
+        self.data = data
+        self.key_names = list(data.index.names)
+
+    def __len__(self):
+        return len(self.data)
+
+    def __contains__(self, key_tuple):
+        return key_tuple in self.data.index
+
+    '''
+    value of a single key, e.g. table.get((30, 'M'), 'rate')
+    '''
+    def get(self, key_tuple, value_column, default=None):
+        if key_tuple not in self.data.index:
+            return default
+        return self.data.at[key_tuple, value_column]
+
+    def _positions(self, df, key_columns):
+        if len(key_columns) != len(self.key_names):
+            raise ValueError('Expected {} key columns for keys {}, got {}'.format(len(self.key_names), self.key_names, key_columns))
+        if len(key_columns) == 1:
+            keys = pd.Index(df[key_columns[0]])
+        else:
+            keys = pd.MultiIndex.from_arrays([df[c] for c in key_columns])
+        return self.data.index.get_indexer(keys)
+
+    def _nearest_positions(self, df, key_columns, nearest):
+        # for each row of df, position of the row in the table with the same other keys and the nearest value of key `nearest`
+        level = self.key_names.index(nearest)
+        other_keys = [k for k in self.key_names if k != nearest]
+        table = self.data.index.to_frame(index=False)
+        table['_position'] = np.arange(len(table))
+        left = pd.DataFrame({
+            k: df[c].to_numpy() for k, c in zip(self.key_names, key_columns)
+        })
+        left['_row'] = np.arange(len(left))
+        left = left.dropna(subset=self.key_names)
+        for k in self.key_names:
+            left[k] = left[k].astype(table[k].dtype)
+        matched = pd.merge_asof(
+            left.sort_values(nearest),
+            table.sort_values(nearest),
+            on=nearest,
+            by=other_keys or None,
+            direction='nearest',
+        )
+        positions = np.full(len(df), -1)
+        found = matched['_position'].notna().to_numpy()
+        positions[matched['_row'].to_numpy()[found]] = matched['_position'].to_numpy()[found].astype(int)
+        return positions
+
+    '''
+    look up value_column of the table for every row of df in one vectorised operation
+    df: DataFrame, e.g. model points from load_mpf
+    key_columns: columns of df matching the key columns of the table in order, e.g. ['AGE_AT_ENTRY', 'SEX']
+    default: value for rows whose key is not found in the table
+    nearest: name of a key column of the table (e.g. 'age'), rows whose key is not found use the row with
+        the same other keys and the nearest value of this key instead
+    Returns a Series with the same index as df
+    '''
+    def lookup(self, df, key_columns, value_column, default=np.nan, nearest=None):
+        positions = self._positions(df, key_columns)
+        missing = positions == -1
+        if nearest is not None and missing.any():
+            rows = np.flatnonzero(missing)
+            positions[rows] = self._nearest_positions(df.iloc[rows], key_columns, nearest)
+            missing = positions == -1
+        if len(self.data) == 0:
+            return pd.Series(default, index=df.index, name=value_column)
+        values = self.data[value_column].take(np.where(missing, 0, positions))
+        result = pd.Series(values.to_numpy(), index=df.index, name=value_column)
+        if missing.any():
+            result = result.where(~missing, default)
+        return result
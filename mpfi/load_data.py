@@ -1,91 +1,226 @@
+import os
 from pathlib import Path, PurePath
 from glob import glob
+from concurrent.futures import ThreadPoolExecutor
+from functools import partial
 import importlib.util
 import pandas as pd
 from .util import (
-    find_fac_header_row,
-    get_meta,
+    map_file,
+    parse_meta,
+    read_header_meta,
+    data_region,
+    stream_data_region,
+    filter_mask,
+    filter_columns,
+    get_variable_types,
+    merge_variable_types,
+    read_variable_types,
+    known_variable_types,
+    get_column_specs,
+    align_frames,
 )
 from .constants import (
     PROD_NAME_COLUMN,
     EXTENSION_COLUMN,
+    VARIABLE_TYPES_ATTR,
+)
+from .fac import (
+    FacTable,
+)
+from .stats import (
+    logger,
+    stage,
+)
+from .companion import (
+    COMPANION_FORMATS,
+    find_companion,
+    read_companion,
+)
+from .compact import (
+    read_compact,
+    concat_compact,
 )
 from .config_default import (
     default_config,
     default_config_str,
 )
 
-def _load_config():
-    try_file = Path('mpfi-config.py')
-    if try_file.exists():
-        spec = importlib.util.spec_from_file_location('dummy-name', 'mpfi-config.py')
-        custom_config = importlib.util.module_from_spec(spec)
-        spec.loader.exec_module(custom_config)
-        print('Config file mpfi-config.py found.')
-        return custom_config.config
-    print('Config file mpfi-config.py not found in current directory. Falling back to default config.')
-    print('To generate a config file for further edit, run `mpfi.generate_config()`')
-    return default_config
+_configs = {} # absolute path of mpfi-config.py: (mtime, config), None for the default config
+_deprecation_warned = set()
+
+'''
+config of mpfi-config.py in the current directory, or the default config if not found
+The file is executed once, and reused until it is modified.
+config: a config dict to be used instead, keys not given are taken from the default config
+'''
+def _load_config(config=None):
+    if config is not None:
+        return {**default_config, **config}
+    try_file = Path('mpfi-config.py').resolve()
+    try:
+        mtime = try_file.stat().st_mtime_ns
+    except FileNotFoundError:
+        if None not in _configs:
+            logger.info('Config file mpfi-config.py not found in current directory. Falling back to default config. '
+                'To generate a config file for further edit, run `mpfi.generate_config()`')
+            _configs[None] = (None, default_config)
+        return default_config
+    cached = _configs.get(try_file)
+    if cached is not None and cached[0] == mtime:
+        return cached[1]
+    spec = importlib.util.spec_from_file_location('dummy-name', try_file)
+    custom_config = importlib.util.module_from_spec(spec)
+    spec.loader.exec_module(custom_config)
+    logger.info('Config file mpfi-config.py found.')
+    _configs[try_file] = (mtime, custom_config.config)
+    return custom_config.config
+
+def _warn_deprecated(replacement):
+    # once per process, so that calls in a loop do not flood the log
+    if replacement not in _deprecation_warned:
+        _deprecation_warned.add(replacement)
+        logger.warning('this function will be deprecated in the next release. Please switch to `%s` instead.', replacement)
 
 def generate_config():
-    print('Warning: config file will be deprecated in the next release.')
+    logger.warning('config file will be deprecated in the next release.')
     # TODO: check if file exist
     try_file = Path('mpfi-config.py')
     if try_file.exists():
-        print('Aborted. File mpfi-config.py already existed')
+        logger.warning('Aborted. File mpfi-config.py already existed')
     f = open('mpfi-config.py', 'w')
     f.write(default_config_str)
     f.close()
-    print('mpfi-config.py created. Please go ahead and edit the file.')
+    logger.info('mpfi-config.py created. Please go ahead and edit the file.')
 
 def _get_files_from_folder(folder, file_pattern):
-    return [Path(p) for p in glob(folder + file_pattern)]
+    return [Path(p) for p in sorted(glob(folder + file_pattern))]
+
+'''
+files matching file_pattern in sorted order, ** for any sub folders
+binary companions (see companion.py) of other matched files are left out, e.g. C123456.PRO.parquet with mpf/*
+used by all functions taking a file_pattern, so that a pattern selects the same files everywhere
+'''
+def _glob_files(file_pattern):
+    files = [Path(p) for p in sorted(glob(file_pattern, recursive=True)) if os.path.isfile(p)]
+    matched = set(files)
+    return [p for p in files if not (p.suffix[1:] in COMPANION_FORMATS and p.with_suffix('') in matched)]
+
+def _fingerprint(path):
+    stat = os.stat(path)
+    return (stat.st_size, stat.st_mtime_ns)
+
+'''
+compare the files found now with the fingerprints (size, mtime) of the last scan
+paths: {key: path} of the files found now
+known: {key: fingerprint} of the last scan
+Returns the current {key: fingerprint} (files deleted after being listed are left out), and the keys added, changed and deleted
+'''
+def _scan_changes(paths, known):
+    current = {}
+    for key, path in paths.items():
+        try:
+            current[key] = _fingerprint(path)
+        except FileNotFoundError: # deleted after listing
+            continue
+    added = [k for k in current if k not in known]
+    changed = [k for k in current if k in known and known[k] != current[k]]
+    deleted = [k for k in known if k not in current]
+    return current, added, changed, deleted
+
+'''
+read_file: function taking one item of files and returning a DataFrame
+workers: number of threads used to read the files in parallel
+executor: a concurrent.futures.Executor (e.g. ProcessPoolExecutor) to be used instead, read_file must be picklable
+raise_errors: raise the error of the first file failed to load, instead of reporting and skipping it
+    for results which would be silently incomplete without the file (e.g. summaries and diffs)
+Returns the DataFrames in the same order as files. Files failed to load are reported and skipped.
+'''
+def _read_files(read_file, files, workers=None, executor=None, raise_errors=False):
+    if executor is None and workers is not None and workers > 1:
+        with ThreadPoolExecutor(max_workers=workers) as pool:
+            return _read_files(read_file, files, executor=pool, raise_errors=raise_errors)
+
+    if executor is None:
+        results = []
+        for f in files:
+            try:
+                results.append(read_file(f))
+            except Exception as e:
+                if raise_errors:
+                    raise
+                logger.warning('failed to load %s: %r', f, e)
+        return results
+
+    futures = [executor.submit(read_file, f) for f in files]
+    results = []
+    for f, future in zip(files, futures):
+        try:
+            results.append(future.result())
+        except Exception as e:
+            if raise_errors:
+                raise
+            logger.warning('failed to load %s: %r', f, e)
+    return results
 
 def _read_single_mpf(config, full_filename, prod_name, read_csv_options={}):
-    meta = get_meta(full_filename)
-    options = {
-        'skiprows': meta['header_row'],
-        'dtype': {**meta['column_specs'], **config['MPF_COLUMN_SPECS']},
-        'index_col': config['MPF_INDEX_COLUMNS'],
-        'encoding': 'latin-1', # to prevent error while reading garbage footer lines
-        'on_bad_lines': 'warn',
-        'nrows': meta['rows'],
-        'parse_dates': meta['date_columns'],
-        'infer_datetime_format': True,
-        **read_csv_options,
-    }
-    return pd.read_csv(full_filename, **options).dropna(how='all').assign(**{
+    with map_file(full_filename) as buf:
+        meta = parse_meta(buf, full_filename)
+        options = {
+            'dtype': {**meta['column_specs'], **config['MPF_COLUMN_SPECS']},
+            'index_col': config['MPF_INDEX_COLUMNS'],
+            'encoding': 'latin-1',
+            'on_bad_lines': 'warn',
+            'parse_dates': meta['date_columns'],
+            'infer_datetime_format': True,
+            **read_csv_options,
+        }
+        with data_region(buf, meta) as region:
+            df = pd.read_csv(region, **options)
+    return df.dropna(how='all').assign(**{
         config['PROD_NAME_COLUMN']: prod_name,
         config['FILE_NAME_COLUMN']: full_filename,
     })
 
+'''
+Same as load_fac, but returns a FacTable for looking up many keys at once, e.g.
+table.lookup(df, ['AGE_AT_ENTRY', 'SEX'], 'rate')
+'''
+def load_fac_table(filename, read_csv_options={}, cache=None):
+    data = load_fac(filename, read_csv_options, cache)
+    if data is None:
+        return None
+    return FacTable(data)
+
+def _read_single_mpf_path(config, path, read_csv_options={}):
+    return _read_single_mpf(config, str(path), path.stem, read_csv_options)
+
 def _read_fac(full_filename, read_csv_options={}):
-    header_row = find_fac_header_row(full_filename)
-    meta = get_meta(full_filename)
-    options = {
-        'encoding': 'latin-1', # There are some strange characters in the start of .fac files..
-        'skiprows': meta['header_row'],
-        'nrows': 1,
-        **read_csv_options,
-    }
-    cols = pd.read_csv(full_filename, **options).columns
-    first_column_type = {cols[0]: pd.CategoricalDtype(['*'])}
-    key_column_count = int(cols[0][1:])
-    options = {
-        # No column spec for .fac files
-        'encoding': 'latin-1', # There are some strange characters in the start of .fac files..
-        'skiprows': meta['header_row'],
-        'dtype': first_column_type,
-        'index_col': list(range(1, key_column_count)),
-        'on_bad_lines': 'warn',
-        'nrows': meta['rows'],
-        **read_csv_options,
-    }
-    return pd.read_csv(full_filename, **options).dropna(how='all')
+    with map_file(full_filename) as buf:
+        with stage('meta', full_filename, bytes=len(buf)):
+            meta = parse_meta(buf, full_filename)
+        first_column = meta['variable_names'][0]
+        key_column_count = int(first_column[1:])
+        options = {
+            # No column spec for .fac files
+            'encoding': 'latin-1', # There are some strange characters in the start of .fac files..
+            'dtype': {first_column: pd.CategoricalDtype(['*'])},
+            'index_col': list(range(1, key_column_count)),
+            'on_bad_lines': 'warn',
+            **read_csv_options,
+        }
+        with stage('read_csv', full_filename, bytes=meta['data_end'] - meta['header_offset']) as s:
+            with data_region(buf, meta) as region:
+                df = pd.read_csv(region, **options)
+            s.rows = len(df)
+    return df.dropna(how='all')
 
-def load_all(containing_text, file_pattern=None, folder=None, read_csv_options={}):
-    print('Warning: this function will be deprecated in the next release. Please switch to `load_mpf` instead.')
-    config = _load_config()
+'''
+config: a config dict instead of mpfi-config.py, see mpfi-config.py from generate_config() for the keys
+'''
+def load_all(containing_text, file_pattern=None, folder=None, read_csv_options={}, workers=None, executor=None, config=None):
+    _warn_deprecated('load_mpf')
+    config = _load_config(config)
     if file_pattern is None:
         file_pattern = '*.' + config['MPF_EXTENSION']
 
@@ -103,27 +238,33 @@ def load_all(containing_text, file_pattern=None, folder=None, read_csv_options={
                 folder_name = folder
                 break
     if folder_name is None:
-        print('No folder matching the criteria is found. Your criteria:')
-        print(containing_text)
-        print('Folders available (defined in mpfi-config.py): ')
-        print(config['MPF_FOLDERS'])
+        logger.warning('No folder matching the criteria is found. Your criteria: %s. Folders available (defined in mpfi-config.py): %s',
+            containing_text, config['MPF_FOLDERS'])
         return
-    print('Reading from {}, file_pattern {}'.format(folder_name, file_pattern))
+    logger.info('Reading from %s, file_pattern %s', folder_name, file_pattern)
     files = _get_files_from_folder(folder_name, file_pattern)
     if len(files) == 0:
-        print('No model point files match your selection criteria.')
+        logger.warning('No model point files match your selection criteria.')
         return
-    df_from_each_file = (_read_single_mpf(config, str(f), f.stem, read_csv_options) for f in files)
+    df_from_each_file = _read_files(
+        partial(_read_single_mpf_path, config, read_csv_options=read_csv_options),
+        files,
+        workers,
+        executor,
+    )
+    if len(df_from_each_file) == 0:
+        return pd.DataFrame()
     concatenated_df = pd.concat(df_from_each_file, ignore_index=True)
     return concatenated_df
 
 '''
 filename: allow either with .PRO or without; extension defined in mpfi-config.py
 folder: to be read from .env
+config: a config dict instead of mpfi-config.py, same as load_all
 '''
-def load(filename, containing_text=None, folder=None, read_csv_options={}):
-    print('Warning: this function will be deprecated in the next release. Please switch to `load_mpf` instead.')
-    config = _load_config()
+def load(filename, containing_text=None, folder=None, read_csv_options={}, config=None):
+    _warn_deprecated('load_mpf')
+    config = _load_config(config)
     ext_pos = filename.find('.' + config['MPF_EXTENSION'])
     if ext_pos > -1: # has extension specified
         prod_name = filename[0:ext_pos]
@@ -147,44 +288,271 @@ def load(filename, containing_text=None, folder=None, read_csv_options={}):
                 continue
         try_file = Path(full_filename)
         if try_file.exists() and not try_file.is_dir():
-            print('Reading from {}'.format(full_filename))
+            logger.info('Reading from %s', full_filename)
             return _read_single_mpf(config, full_filename, prod_name, read_csv_options)
 
-    print('model point file not found: {}'.format(filename))
-    print('Folders available (defined in mpfi-config.py): ')
-    print(config['MPF_FOLDERS'])
+    logger.warning('model point file not found: %s. Folders available (defined in mpfi-config.py): %s', filename, config['MPF_FOLDERS'])
     return None
 
-def load_fac(filename, read_csv_options={}):
+'''
+cache: an MpfCache, the parsed table is reused until the file is changed
+'''
+def load_fac(filename, read_csv_options={}, cache=None):
     try_file = Path(filename)
     if not try_file.exists() or try_file.is_dir():
-        print('fac file not found: {}'.format(filename))
+        logger.warning('fac file not found: %s', filename)
         return None
-    print('Reading from {}'.format(filename))
+    logger.info('Reading from %s', filename)
+    if cache is not None:
+        return cache.load(partial(_read_fac, read_csv_options=read_csv_options), filename, read_csv_options)
     return _read_fac(filename, read_csv_options)
 
 
-def _read_mpf(path, read_csv_options={}):
-    meta = get_meta(path)
-    options = {
-        'skiprows': meta['header_row'],
+'''
+columns of the file to be parsed (usecols), in the order of the file
+the first column (! or &) is always read for identifying empty lines
+'''
+def _get_usecols(meta, columns, filter):
+    if columns is None:
+        return None
+    wanted = set(columns) | set(filter_columns(filter))
+    names = meta['variable_names']
+    return [names[0]] + [c for c in names[1:] if c in wanted]
+
+def _mpf_read_csv_options(meta, read_csv_options, usecols):
+    return {
         'encoding': 'utf-8',
-        'encoding_errors': 'ignore', # to prevent error while reading garbage footer
-        'nrows': meta['rows'],
-        'parse_dates': meta['date_columns'],
+        'encoding_errors': 'ignore',
+        'parse_dates': [c for c in meta['date_columns'] if usecols is None or c in usecols],
+        **({} if usecols is None else {'usecols': usecols}),
         **read_csv_options,
         'dtype': meta['column_specs'] | read_csv_options.get('dtype', {}),
     }
-    return pd.read_csv(path, **options).dropna(how='all').assign(**{
+
+def _select_mpf_rows(df, path, variable_types, columns, filter, usecols):
+    df = df.dropna(how='all')
+    if filter:
+        df = df[filter_mask(df, filter)]
+    if usecols is not None:
+        df = df[[c for c in df.columns if c in columns]]
+    df = df.assign(**{
         PROD_NAME_COLUMN: path.stem,
         EXTENSION_COLUMN: path.suffix,
     })
+    # kept for export_mpf with the option column_types='loaded'
+    df.attrs[VARIABLE_TYPES_ATTR] = variable_types
+    return df
+
+'''
+dtypes to convert the columns of a companion to, for the same result as parsing the text file with dtype
+text columns can be read as any text dtype (e.g. str, 'string', 'category'), and numbers as any numeric dtype
+Returns None if any dtype cannot be applied that way (e.g. numbers read as text keep their format in the text file)
+'''
+def _companion_dtypes(df, variable_types, dtype):
+    result = {}
+    for c, t in dtype.items():
+        if c not in df.columns:
+            continue
+        t = pd.api.types.pandas_dtype(t)
+        if df[c].dtype == t:
+            continue
+        if variable_types.get(c, '')[:1] == 'T' and t.kind in 'OU':
+            # str and object are how the text columns are already read
+            if t.kind == 'O' and t != object:
+                result[c] = t
+        elif df[c].dtype.kind in 'iuf' and t.kind in 'iuf':
+            result[c] = t
+        else:
+            return None
+    return result
+
+'''
+read the binary companion (see companion.py) instead of parsing the text file of path
+only the dtype of read_csv_options is applied, see _companion_dtypes
+Returns None if the text file has to be parsed instead
+'''
+def _read_mpf_companion(path, companion, format, read_csv_options={}, columns=None, filter=None):
+    wanted = None if columns is None else set(columns) | set(filter_columns(filter))
+    with stage('read_companion', path, bytes=os.path.getsize(companion)) as s:
+        df, variable_types = read_companion(companion, format, wanted)
+        s.rows = len(df)
+    dtype = _companion_dtypes(df, variable_types, read_csv_options.get('dtype', {}))
+    if dtype is None:
+        return None
+    if dtype:
+        df = df.astype(dtype)
+    with stage('select', path) as s:
+        df = _select_mpf_rows(df, path, variable_types, columns, filter, wanted)
+        s.rows = len(df)
+    return df
+
+'''
+parse the text of a model point file, before the rows are selected (see _select_mpf_rows)
+Returns the DataFrame, the meta and the columns parsed (None if all)
+'''
+def _parse_mpf(path, read_csv_options={}, columns=None, filter=None):
+    # the file is memory mapped; only the header and data lines (not the footer) are passed to read_csv
+    with map_file(path) as buf:
+        with stage('meta', path, bytes=len(buf)):
+            meta = parse_meta(buf, path)
+        usecols = _get_usecols(meta, columns, filter)
+        options = _mpf_read_csv_options(meta, read_csv_options, usecols)
+        with stage('read_csv', path, bytes=meta['data_end'] - meta['header_offset']) as s:
+            with data_region(buf, meta) as region:
+                df = pd.read_csv(region, **options)
+            s.rows = len(df)
+    return df, meta, usecols
+
+'''
+companion: read the binary companion of path written by export_mpf instead, if it is written from the current
+    content of path and read_csv_options has no options other than dtype
+'''
+def _read_mpf(path, read_csv_options={}, columns=None, filter=None, companion=True):
+    if companion and set(read_csv_options) <= {'dtype'}:
+        found = find_companion(path)
+        if found is not None:
+            df = _read_mpf_companion(path, *found, read_csv_options, columns, filter)
+            if df is not None:
+                return df
+    df, meta, usecols = _parse_mpf(path, read_csv_options, columns, filter)
+    with stage('select', path) as s:
+        df = _select_mpf_rows(df, path, get_variable_types(meta), columns, filter, usecols)
+        s.rows = len(df)
+    return df
+
+def _iter_single_mpf(path, chunksize, read_csv_options={}, columns=None, filter=None):
+    with open(path, 'rb') as f:
+        with stage('meta', path):
+            meta = read_header_meta(f, path)
+        usecols = _get_usecols(meta, columns, filter)
+        options = _mpf_read_csv_options(meta, read_csv_options, usecols)
+        rows = 0
+        with pd.read_csv(stream_data_region(f, meta), chunksize=chunksize, **options) as reader:
+            for chunk in reader:
+                rows += len(chunk)
+                with stage('select', path) as s:
+                    chunk = _select_mpf_rows(chunk, path, get_variable_types(meta), columns, filter, usecols)
+                    s.rows = len(chunk)
+                if len(chunk) > 0:
+                    yield chunk
+    if meta['numlines'] != -1 and meta['numlines'] != rows:
+        logger.warning('actual lines loaded (%s) different from NUMLINES shown in model point (%s) in: %s', rows, meta['numlines'], path)
+
+'''
+Same as load_mpf, but yields DataFrames of at most chunksize rows instead,
+so that files larger than memory can be processed. Files are read one after another in sorted order.
+e.g. export_mpf_chunks(chunk[chunk['SUM_ASSURED'] > 0] for chunk in iter_mpf('mpf/*.PRO'), 'output/')
+'''
+def iter_mpf(file_pattern, chunksize=100000, read_csv_options={}, columns=None, filter=None):
+    for f in _glob_files(file_pattern):
+        yield from _iter_single_mpf(f, chunksize, read_csv_options, columns, filter)
 
-def load_mpf(file_pattern, read_csv_options={}):
-    files = [Path(p) for p in glob(file_pattern)]
+'''
+function reading a single model point file (path) into a DataFrame, through the cache if given
+'''
+def _mpf_reader(read_csv_options={}, cache=None, columns=None, filter=None, companion=True):
+    read_file = partial(_read_mpf, read_csv_options=read_csv_options, columns=columns, filter=filter, companion=companion)
+    if cache is not None:
+        cache_key = {**read_csv_options}
+        if columns is not None or filter:
+            cache_key['mpfi_selection'] = (columns, filter)
+        read_file = partial(cache.load, read_file, read_csv_options=cache_key)
+    return read_file
+
+'''
+read_csv dtype for loading files, from the VARIABLE_TYPES in the header of all files,
+so that each column is parsed into the same dtype in every file (e.g. N if I in some files and N in others)
+'''
+def _unified_dtypes(files):
+    return get_column_specs(merge_variable_types(_header_variable_types(files)))
+
+'''
+VARIABLE_TYPES in the header of each of files, without the unknown types (see known_variable_types)
+'''
+def _header_variable_types(files):
+    variable_types_list = []
+    for f in files:
+        try:
+            variable_types_list.append(known_variable_types(read_variable_types(f)))
+        except OSError: # reported when the file is read
+            continue
+    return variable_types_list
+
+def _with_dtype(read_csv_options, dtype):
+    # dtype given in read_csv_options takes precedence
+    return {**read_csv_options, 'dtype': {**dtype, **read_csv_options.get('dtype', {})}}
+
+'''
+read_csv_options for loading files, with the unified dtypes of files if unify_schema (see _unified_dtypes)
+'''
+def _schema_options(files, read_csv_options, unify_schema):
+    if not unify_schema or len(files) <= 1:
+        return read_csv_options
+    with stage('unify_schema'):
+        dtype = _unified_dtypes(files)
+    return _with_dtype(read_csv_options, dtype)
+
+'''
+compact: the DataFrames are from compact_frame, see concat_compact
+'''
+def _concat_mpf(dfs, compact=False):
+    with stage('concat') as s:
+        if compact:
+            result = concat_compact(align_frames(dfs))
+        else:
+            result = pd.concat(align_frames(dfs), ignore_index=True)
+        result.attrs[VARIABLE_TYPES_ATTR] = merge_variable_types(df.attrs.get(VARIABLE_TYPES_ATTR, {}) for df in dfs)
+        s.rows = len(result)
+    return result
+
+'''
+file_pattern: glob pattern of the model point files, ** for any sub folders, files are loaded in sorted order
+workers: number of threads for loading the files in parallel
+executor: alternatively a concurrent.futures.Executor, e.g. ProcessPoolExecutor
+cache: an MpfCache, unchanged files are loaded from the cache instead of being parsed again
+columns: list of columns to be loaded, other columns are not parsed. _PROD_NAME and _EXTENSION are always added
+filter: list of (column, operator, value) for selecting rows while loading each file, combined with "and"
+    e.g. [('PLAN_CODE', 'in', ['ABC', 'DEF']), ('PREM_FREQ', '==', 1)]
+    operator is one of ==, !=, <, <=, >, >=, in, not in
+catalog: an MpfCatalog of the files, for skipping the files without the filter columns
+    and reading each column with the same dtype in all files without reading the headers of the files (unless unify_schema=False)
+unify_schema: read each column with the same dtype in all files, based on VARIABLE_TYPES of all files,
+    and keep nullable integer / categorical columns when some files do not have the column
+compact: use less memory by storing text columns with few distinct values (and _PROD_NAME, _EXTENSION) as category,
+    other text columns as pyarrow strings (if pyarrow is installed), and I/S columns in the smallest integer type
+    the memory usage before and after is logged (at INFO level of the mpfi logger)
+    the I/S types in VARIABLE_TYPES are kept when exporting with export_mpf
+companion: read the binary companion (e.g. C123456.PRO.parquet, see export_mpf option companion) of a file instead,
+    if the file is not changed since the companion is written, and read_csv_options has no options other than dtype
+    files matched by file_pattern which are companions of other matched files are not loaded as model point files
+'''
+def load_mpf(file_pattern, read_csv_options={}, workers=None, executor=None, cache=None, columns=None, filter=None, compact=False, catalog=None, unify_schema=True, companion=True):
+    files = _glob_files(file_pattern)
+    if catalog is not None:
+        files, dtype = catalog.plan(files, filter, unify_schema)
+        read_csv_options = _with_dtype(read_csv_options, dtype)
+    else:
+        read_csv_options = _schema_options(files, read_csv_options, unify_schema)
     if len(files) == 0:
         return pd.DataFrame()
-    return pd.concat([
-        _read_mpf(f, read_csv_options)
-        for f in files
-    ], ignore_index=True)
+    read_file = _mpf_reader(read_csv_options, cache, columns, filter, companion)
+    if compact:
+        read_file = partial(read_compact, read_file)
+    dfs = _read_files(
+        read_file,
+        files,
+        workers,
+        executor,
+    )
+    if len(dfs) == 0:
+        return pd.DataFrame()
+    if compact:
+        memory_before = sum(m for _, m in dfs)
+        result = _concat_mpf([df for df, _ in dfs], compact=True)
+        logger.info(
+            'Memory usage: %.1fMB (compact) vs %.1fMB',
+            result.memory_usage(deep=True).sum() / 1024 ** 2,
+            memory_before / 1024 ** 2,
+        )
+        return result
+    return _concat_mpf(dfs)
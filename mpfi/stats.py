@@ -0,0 +1,131 @@
+import logging
+import time
+import tracemalloc
+import pandas as pd
+
+# warnings (e.g. files failed to load, NUMLINES not matched) and progress messages of mpfi
+logger = logging.getLogger('mpfi')
+
+_hooks = []
+
+'''
+hook: function called with a dict for each stage of each file processed, with keys
+    stage: e.g. meta, read_csv, select, concat, infer_types, plan, digest, write
+    path: the file (None for stages over all files, e.g. concat, plan)
+    seconds: wall time
+    rows: rows processed, None if not applicable
+    bytes: bytes read or written, None if not applicable
+    peak_memory: peak traced memory during the stage, None unless tracemalloc is tracing
+Hooks are called in the thread doing the work; stages run by a ProcessPoolExecutor are not reported.
+'''
+def add_stats_hook(hook):
+    _hooks.append(hook)
+
+def remove_stats_hook(hook):
+    _hooks.remove(hook)
+
+class _Stage:
+    def __init__(self, name, path, rows, bytes):
+        self.name = name
+        self.path = path
+        self.rows = rows
+        self.bytes = bytes
+
+    def __enter__(self):
+        self._tracing = tracemalloc.is_tracing()
+        if self._tracing:
+            tracemalloc.reset_peak()
+        self._start = time.perf_counter()
+        return self
+
+    def __exit__(self, exc_type, exc_value, traceback):
+        seconds = time.perf_counter() - self._start
+        if exc_type is not None:
+            return False
+        record = {
+            'stage': self.name,
+            'path': None if self.path is None else str(self.path),
+            'seconds': seconds,
+            'rows': self.rows,
+            'bytes': self.bytes,
+            'peak_memory': tracemalloc.get_traced_memory()[1] if self._tracing else None,
+        }
+        for hook in list(_hooks):
+            hook(record)
+        return False
+
+class _NullStage:
+    def __enter__(self):
+        return self
+
+    def __exit__(self, exc_type, exc_value, traceback):
+        return False
+
+    def __setattr__(self, name, value):
+        pass
+
+_NULL_STAGE = _NullStage()
+
+'''
+context manager timing a stage for the stats hooks, rows and bytes can also be set on the returned object
+does nothing when there is no hook
+e.g.
+with stage('read_csv', path) as s:
+    df = pd.read_csv(...)
+    s.rows = len(df)
+'''
+def stage(name, path=None, rows=None, bytes=None):
+    if not _hooks:
+        return _NULL_STAGE
+    return _Stage(name, path, rows, bytes)
+
+'''
+Collects the stats of the stages of loading / exporting while in use, e.g.
+with mpfi.MpfStats() as stats:
+    df = mpfi.load_mpf('mpf/*.PRO', workers=8)
+stats.summary() # time, rows and bytes by stage
+stats.to_frame() # one row per stage per file
+
+trace_memory: trace the memory allocations for peak_memory (with tracemalloc, which slows down the processing)
+    peak memory of stages running in parallel threads is not separated
+'''
+class MpfStats:
+    COLUMNS = ['stage', 'path', 'seconds', 'rows', 'bytes', 'peak_memory']
+
+    def __init__(self, trace_memory=False):
+        self.trace_memory = trace_memory
+        self.records = []
+        self._started_tracing = False
+
+    def __call__(self, record):
+        self.records.append(record)
+
+    def __enter__(self):
+        if self.trace_memory and not tracemalloc.is_tracing():
+            tracemalloc.start()
+            self._started_tracing = True
+        add_stats_hook(self)
+        return self
+
+    def __exit__(self, exc_type, exc_value, traceback):
+        remove_stats_hook(self)
+        if self._started_tracing:
+            tracemalloc.stop()
+            self._started_tracing = False
+        return False
+
+    def to_frame(self):
+        return pd.DataFrame(self.records, columns=self.COLUMNS)
+
+    '''
+    total seconds, rows and bytes, number of records and maximum peak_memory by stage, in the order first run
+    '''
+    def summary(self):
+        df = self.to_frame()
+        return df.groupby('stage', sort=False).agg(
+            seconds=('seconds', 'sum'),
+            records=('seconds', 'count'),
+            rows=('rows', 'sum'),
+            bytes=('bytes', 'sum'),
+            peak_memory=('peak_memory', 'max'),
+        )
@@ -0,0 +1,96 @@
+from functools import partial
+import pandas as pd
+from .constants import (
+    PROD_NAME_COLUMN,
+    EXTENSION_COLUMN,
+)
+from .load_data import (
+    _iter_single_mpf,
+    _read_files,
+    _glob_files,
+)
+
+# aggregations which can be merged from partial results, with how the partial results are merged
+_MERGE_AGGS = {
+    'sum': 'sum',
+    'count': 'sum',
+    'min': 'min',
+    'max': 'max',
+}
+SUPPORTED_AGGS = list(_MERGE_AGGS) + ['mean']
+
+def _components(aggs):
+    # partial aggregations needed, as {partial column name: (column, agg)}
+    components = {}
+    for column, agg in aggs.values():
+        if agg not in SUPPORTED_AGGS:
+            raise ValueError('Unsupported aggregation: {}, must be one of {}'.format(agg, SUPPORTED_AGGS))
+        for base in (['sum', 'count'] if agg == 'mean' else [agg]):
+            components['{}__{}'.format(column, base)] = (column, base)
+    return components
+
+def _partial(df, by, components):
+    return df.groupby(by, observed=True, dropna=False).agg(**components)
+
+def _merge(partials, by, components):
+    combined = pd.concat(partials)
+    return combined.groupby(level=list(range(len(by))), observed=True, dropna=False).agg({
+        name: _MERGE_AGGS[base] for name, (_, base) in components.items()
+    })
+
+def _summarize_file(path, by, components, chunksize, read_csv_options, filter, merge_every):
+    columns = list(dict.fromkeys(
+        [c for c in by if c not in [PROD_NAME_COLUMN, EXTENSION_COLUMN]]
+        + [column for column, _ in components.values()]
+    ))
+    partials = []
+    for chunk in _iter_single_mpf(path, chunksize, read_csv_options, columns, filter):
+        partials.append(_partial(chunk, by, components))
+        # keep memory proportional to the number of groups
+        if len(partials) >= merge_every:
+            partials = [_merge(partials, by, components)]
+    if len(partials) == 0:
+        return None
+    return _merge(partials, by, components)
+
+'''
+Summary of the model point files by groups, without loading the files into memory
+file_pattern: glob pattern of the model point files, ** for any sub folders
+by: columns to group by, e.g. ['_PROD_NAME', 'SPCODE', 'PLAN_CODE']
+aggs: {output column: (column, aggregation)}, aggregation is one of sum, count, min, max, mean
+    e.g. {'policies': ('INIT_POLS_IF', 'sum'), 'sum_assured': ('SUM_ASSURED', 'sum'), 'records': ('SPCODE', 'count')}
+chunksize: number of rows read at a time from each file
+filter: same as load_mpf
+workers / executor: for summarizing the files in parallel, same as load_mpf
+A file failed to read raises the error (unlike load_mpf), instead of being left out of the summary
+Returns a DataFrame indexed by the by columns
+'''
+def summarize_mpf(file_pattern, by, aggs, chunksize=100000, read_csv_options={}, filter=None, workers=None, executor=None):
+    components = _components(aggs)
+    files = _glob_files(file_pattern)
+    partials = _read_files(
+        partial(
+            _summarize_file,
+            by=by,
+            components=components,
+            chunksize=chunksize,
+            read_csv_options=read_csv_options,
+            filter=filter,
+            merge_every=10,
+        ),
+        files,
+        workers,
+        executor,
+        raise_errors=True,
+    )
+    partials = [p for p in partials if p is not None]
+    if len(partials) == 0:
+        return pd.DataFrame(columns=list(aggs))
+    merged = _merge(partials, by, components)
+    result = pd.DataFrame(index=merged.index)
+    for name, (column, agg) in aggs.items():
+        if agg == 'mean':
+            result[name] = merged['{}__sum'.format(column)] / merged['{}__count'.format(column)]
+        else:
+            result[name] = merged['{}__{}'.format(column, agg)]
+    return result.sort_index()
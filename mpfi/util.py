@@ -1,13 +1,17 @@
+import io
 import re
+import mmap
+from contextlib import contextmanager
 import pandas as pd
 import numpy as np
+from .stats import logger
 
 '''
 data: pandas DataFrame
 key_tuple: a tuple which is the "index_col" of the data
 '''
 def is_exist(data, key_tuple):
-    return data.index.isin([key_tuple]).any()
+    return key_tuple in data.index
 
 def get_index_values(data, column):
     return data.index.get_level_values(column)
@@ -17,73 +21,370 @@ find header row of a .fac or a model point file (the row starting with !)
 zero-indexed, i.e. if the header is at the first row, it will return 0
 '''
 def find_fac_header_row(filename):
+    with map_file(filename) as buf:
+        if buf[:1] == b'!':
+            return 0
+        position = buf.find(b'\n!')
+        if position == -1:
+            return None
+        return _count(buf, b'\n', 0, position + 1)
+
+'''
+the content of a file as a read-only memory map (bytes for an empty file)
+'''
+@contextmanager
+def map_file(filename):
+    with open(filename, 'rb') as f:
+        try:
+            buf = mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ)
+        except ValueError: # empty file cannot be mapped
+            yield b''
+            return
+        with buf:
+            yield buf
+
+'''
+number of occurrences of sub in buf[start:end], counted block by block as mmap has no count()
+'''
+def _count(buf, sub, start, end, block_size=1 << 24):
+    if isinstance(buf, bytes):
+        return buf.count(sub, start, end)
     result = 0
-    # strange characters.. need to set encoding
-    with open(filename, 'r', encoding='latin-1') as f:
-        for line in f:
-            if line[0] == '!':
-                return result
-            result += 1
+    for position in range(start, end, block_size):
+        # extends by len(sub) - 1 bytes so that occurrences across blocks are counted once
+        result += buf[position:min(position + block_size + len(sub) - 1, end)].count(sub)
+    return result
 
-def get_meta(filename):
-    result = {
+_NUMLINES_PATTERN = re.compile(r"^NUMLINES,[\s]*([\d]+)")
+_VARIABLE_TYPES_PATTERN = re.compile(r"^VARIABLE_TYPES,")
+
+# the first newline which is not followed by a data line (or a blank line), i.e. start of the footer
+_DATA_END_PATTERN = re.compile(rb'\n(?![*\r\n])')
+
+class _BytesRegion(io.RawIOBase):
+    '''
+    read-only file object over buf[start:end] without copying the buffer,
+    so that pandas.read_csv can parse only the data region of a file
+    '''
+    def __init__(self, buf, start, end):
+        self._view = memoryview(buf)[start:end]
+        self._pos = 0
+
+    def readable(self):
+        return True
+
+    def close(self):
+        # a memory map cannot be closed while it is still viewed
+        self._view.release()
+        super().close()
+
+    def readinto(self, b):
+        size = min(len(b), len(self._view) - self._pos)
+        b[:size] = self._view[self._pos:self._pos + size]
+        self._pos += size
+        return size
+
+class _StreamRegion(io.RawIOBase):
+    '''
+    read-only file object of the header line and the data lines of an open (binary) file,
+    reading the file block by block so that memory is bounded by block_size
+    '''
+    def __init__(self, f, meta, block_size=1 << 20):
+        f.seek(meta['header_offset'])
+        self._pending = memoryview(f.readline())
+        f.seek(meta['data_offset'])
+        self._f = f
+        self._block_size = block_size
+        self._carry = b''
+        self._done = False
+
+    def readable(self):
+        return True
+
+    def _fill(self):
+        block = self._carry + self._f.read(self._block_size)
+        if len(block) == len(self._carry): # end of file
+            self._pending = memoryview(block)
+            self._done = True
+            return
+        matching_end = _DATA_END_PATTERN.search(block)
+        # a newline at the end of the block cannot be decided until the next byte is read
+        if matching_end is not None and matching_end.start() < len(block) - 1:
+            self._pending = memoryview(block)[:matching_end.start() + 1]
+            self._done = True
+            return
+        self._pending = memoryview(block)[:-1]
+        self._carry = block[-1:]
+
+    def readinto(self, b):
+        while len(self._pending) == 0 and not self._done:
+            self._fill()
+        size = min(len(b), len(self._pending))
+        b[:size] = self._pending[:size]
+        self._pending = self._pending[size:]
+        return size
+
+def _read_header(lines):
+    '''
+    lines: iterable of (byte offset, decoded line)
+    consume lines until the first data line (starting with *)
+    '''
+    header = {
         'header_row': -1,
-        'rows': 0,
-        'column_specs': {},
-        'date_columns': [],
+        'header_offset': -1,
+        'data_offset': -1,
+        'numlines': -1,
+        'variable_names': None,
+        'variable_types': None,
     }
-    variable_types = None
-    numlines = -1
-    current_line = -1
-    passed_content = False
-    with open(filename, 'r', encoding='latin-1') as f:
-        for line in f:
-            current_line = current_line + 1
-            matching_numlines = re.match(r"^NUMLINES,[\s]*([\d]+)", line)
-            matching_formats = re.match(r"^VARIABLE_TYPES,", line)
-            if matching_numlines is not None:
-                numlines = int(matching_numlines[1])
-            elif matching_formats is not None:
-                variable_types = line.strip().split(',')[1:] # first column is VARIABLE_TYPES, not used
-            elif not passed_content and (line[0] == '!' or line[0] == '&'):
-                result['header_row'] = current_line # zero-based
-                variable_names = line.strip().split(',')
-            elif line[0] == '*':
-                passed_content = True
-                result['rows'] = result['rows'] + 1
-
-    if result['header_row'] == -1 or result['rows'] == 0:
-        print('Malformed model point file format in: ' + filename)
-        raise ValueError
+    for current_line, (offset, line) in enumerate(lines):
+        if line[:1] == '*':
+            header['data_offset'] = offset
+            break
+        matching_numlines = _NUMLINES_PATTERN.match(line)
+        if matching_numlines is not None:
+            header['numlines'] = int(matching_numlines[1])
+        elif _VARIABLE_TYPES_PATTERN.match(line) is not None:
+            header['variable_types'] = line.strip().split(',')[1:] # first column is VARIABLE_TYPES, not used
+        elif line[:1] == '!' or line[:1] == '&':
+            header['header_row'] = current_line # zero-based
+            header['header_offset'] = offset
+            header['variable_names'] = line.strip().split(',')
+    return header
+
+def _iter_buffer_lines(buf):
+    offset = 0
+    while offset < len(buf):
+        end = buf.find(b'\n', offset)
+        end = len(buf) if end == -1 else end + 1
+        yield offset, buf[offset:end].decode('latin-1')
+        offset = end
 
-    if numlines != -1 and numlines != result['rows']:
-        print('Warning: actual lines loaded ({}) different from NUMLINES shown in model point ({}) in: {}'.format(result['rows'], numlines, filename))
+def _iter_file_lines(f):
+    offset = 0
+    for line in f:
+        yield offset, line.decode('latin-1')
+        offset += len(line)
 
-    # set formats
+def _set_column_specs(result):
+    variable_types = result['variable_types']
+    variable_names = result['variable_names']
+    result['column_specs'] = {}
+    result['date_columns'] = []
     if variable_types is None:
-        print('Warning: Row of variable types is not found. Data types will be automatically assigned by pandas')
+        logger.warning('Row of variable types is not found. Data types will be automatically assigned by pandas')
         return result
 
     if len(variable_types) != len(variable_names):
-        print('Warning: Malformed model point file (variable_types) -- number of columns not matched. Data types will be automatically assigned by pandas')
+        logger.warning('Malformed model point file (variable_types) -- number of columns not matched. Data types will be automatically assigned by pandas')
         return result
 
-    result['column_specs'] = dict([
-        (
-            variable_names[i],
-            {
-                'V': pd.CategoricalDtype(['*']), # for ! column with VARIABLE_TYPES
-                'T': np.dtype('str'),
-                'I': pd.Int32Dtype(),
-                'S': pd.Int16Dtype(),
-                'N': np.float64,
-            }[variable_types[i][0]],
-        ) for i in range(0, len(variable_types))
-        if variable_types[i][0] != 'D'
-    ])
-    result['date_columns'] = [
-        variable_names[i]
-        for i in range(0, len(variable_types))
-        if variable_types[i][0] == 'D'
-    ]
+    variable_types = dict(zip(variable_names, variable_types))
+    result['column_specs'] = get_column_specs(variable_types)
+    result['date_columns'] = [name for name, t in variable_types.items() if t[0] == 'D']
+    return result
+
+_DTYPES = {
+    'V': pd.CategoricalDtype(['*']), # for ! column with VARIABLE_TYPES
+    'T': np.dtype('str'),
+    'I': pd.Int32Dtype(),
+    'S': pd.Int16Dtype(),
+    'N': np.float64,
+}
+
+'''
+variable_types without the columns of an unknown (or empty) type, e.g. for merging the VARIABLE_TYPES of many files
+a file with such a type fails by itself when it is loaded
+'''
+def known_variable_types(variable_types):
+    return {name: t for name, t in variable_types.items() if t[:1] in _DTYPES or t[:1] == 'D'}
+
+'''
+variable_types: {column: Prophet variable type}
+Returns {column: dtype} for read_csv, date columns are excluded
+'''
+def get_column_specs(variable_types):
+    return {
+        name: _DTYPES[t[0]]
+        for name, t in variable_types.items()
+        if t[0] != 'D'
+    }
+
+'''
+read only the header lines of a model point / .fac file, stopping at the first data line
+the number of rows is not counted, see get_meta / parse_meta for that
+'''
+def get_header_meta(filename):
+    with open(filename, 'rb') as f:
+        return read_header_meta(f, filename)
+
+def read_header_meta(f, filename):
+    f.seek(0)
+    result = _read_header(_iter_file_lines(f))
+    if result['header_row'] == -1 or result['data_offset'] == -1:
+        logger.error('Malformed model point file format in: %s', filename)
+        raise ValueError
+    return _set_column_specs(result)
+
+def _find_data_offset(buf):
+    if buf[:1] == b'*':
+        return 0
+    position = buf.find(b'\n*')
+    return -1 if position == -1 else position + 1
+
+'''
+{column: variable type} from the header lines of a file, without warnings; empty if not available
+'''
+def read_variable_types(filename):
+    with open(filename, 'rb') as f:
+        header = _read_header(_iter_file_lines(f))
+    if header['variable_names'] is None:
+        return {}
+    return get_variable_types(header)
+
+'''
+buf: the whole content of a model point / .fac file, bytes or a memory map (see map_file)
+The data region (consecutive lines starting with *) and its row count are found by byte searches;
+only the header lines before the first data line are decoded.
+Byte offsets in the result:
+    header_offset: start of the header line (! or &)
+    data_offset: start of the first data line
+    last_data_offset: start of the last data line
+    data_end: end of the last data line, i.e. start of the footer
+'''
+def parse_meta(buf, filename):
+    data_offset = _find_data_offset(buf)
+    result = _read_header(_iter_buffer_lines(bytes(buf[:max(data_offset, 0)])))
+    result['data_offset'] = data_offset
+    if result['header_row'] == -1 or result['data_offset'] == -1:
+        logger.error('Malformed model point file format in: %s', filename)
+        raise ValueError
+
+    matching_end = _DATA_END_PATTERN.search(buf, result['data_offset'])
+    result['data_end'] = len(buf) if matching_end is None else matching_end.start() + 1
+    last_newline = buf.rfind(b'\n*', result['data_offset'], result['data_end'])
+    result['last_data_offset'] = result['data_offset'] if last_newline == -1 else last_newline + 1
+    result['rows'] = _count(buf, b'\n*', result['header_offset'], result['data_end'])
+
+    if result['numlines'] != -1 and result['numlines'] != result['rows']:
+        logger.warning('actual lines loaded (%s) different from NUMLINES shown in model point (%s) in: %s', result['rows'], result['numlines'], filename)
+
+    return _set_column_specs(result)
+
+def get_meta(filename):
+    with map_file(filename) as buf:
+        return parse_meta(buf, filename)
+
+'''
+file object of the header line and the data lines only, to be passed to pandas.read_csv
+it should be closed before buf if buf is a memory map, e.g. `with data_region(buf, meta) as f:`
+'''
+def data_region(buf, meta):
+    return io.BufferedReader(_BytesRegion(buf, meta['header_offset'], meta['data_end']))
+
+'''
+same as data_region, but reading from an open binary file with meta from read_header_meta,
+without loading the whole file into memory
+'''
+def stream_data_region(f, meta):
+    return io.BufferedReader(_StreamRegion(f, meta))
+
+_FILTER_OPERATORS = {
+    '==': lambda s, v: s == v,
+    '!=': lambda s, v: s != v,
+    '<': lambda s, v: s < v,
+    '<=': lambda s, v: s <= v,
+    '>': lambda s, v: s > v,
+    '>=': lambda s, v: s >= v,
+    'in': lambda s, v: s.isin(v),
+    'not in': lambda s, v: ~s.isin(v),
+}
+
+'''
+filter: list of (column, operator, value), combined with "and"
+    e.g. [('PLAN_CODE', 'in', ['ABC', 'DEF']), ('PREM_FREQ', '==', 1)]
+    operator is one of ==, !=, <, <=, >, >=, in, not in
+Rows are not selected if the column does not exist in data.
+Returns a boolean numpy array.
+'''
+def filter_mask(data, filter):
+    mask = np.ones(len(data), dtype=bool)
+    for column, operator, value in filter:
+        if operator not in _FILTER_OPERATORS:
+            raise ValueError('Unsupported filter operator: {}'.format(operator))
+        if column not in data.columns:
+            return np.zeros(len(data), dtype=bool)
+        mask &= _FILTER_OPERATORS[operator](data[column], value).fillna(False).to_numpy(dtype=bool)
+    return mask
+
+def filter_columns(filter):
+    return [column for column, _, _ in filter or []]
+
+'''
+merge two Prophet variable types of the same column, e.g. from different files or chunks
+T widths are widened, integers are widened to N if mixed with numbers
+Returns None if the types are not compatible
+'''
+def merge_prophet_type(a, b):
+    if a == b:
+        return a
+    if a[0] == 'T' and b[0] == 'T':
+        return 'T{}'.format(max(int(a[1:] or 0), int(b[1:] or 0)))
+    if a in ['I', 'S', 'N'] and b in ['I', 'S', 'N']:
+        return 'N' if 'N' in [a, b] else 'I'
+    return None
+
+'''
+{column name: variable type} of a model point file from its meta, empty if VARIABLE_TYPES is not usable
+'''
+def get_variable_types(meta):
+    names = meta['variable_names']
+    types = meta['variable_types']
+    if types is None or len(types) != len(names):
+        return {}
+    return dict(zip(names, types))
+
+def merge_variable_types(variable_types_list):
+    result = {}
+    conflicted = set()
+    for variable_types in variable_types_list:
+        for column, variable_type in variable_types.items():
+            if column in conflicted:
+                continue
+            merged = variable_type if column not in result else merge_prophet_type(result[column], variable_type)
+            if merged is None:
+                conflicted.add(column)
+                del result[column]
+            else:
+                result[column] = merged
+    return result
+
+'''
+prepare DataFrames for pd.concat without falling back to object dtype:
+columns missing in a DataFrame are added as all-NA of the dtype in the other DataFrames,
+and categorical columns are set to the union of their categories
+'''
+def align_frames(dfs):
+    dtypes = {}
+    for df in dfs:
+        for column, dtype in df.dtypes.items():
+            dtypes.setdefault(column, []).append(dtype)
+    target = {}
+    for column, column_dtypes in dtypes.items():
+        if all(isinstance(d, pd.CategoricalDtype) for d in column_dtypes):
+            categories = pd.api.types.union_categoricals(
+                [pd.Categorical([], dtype=d) for d in column_dtypes],
+                ignore_order=True,
+            ).categories
+            target[column] = pd.CategoricalDtype(categories)
+        else:
+            target[column] = column_dtypes[0]
+    result = []
+    for df in dfs:
+        missing = {c: pd.Series(index=df.index, dtype=target[c]) for c in target if c not in df.columns}
+        df = df.assign(**missing) if missing else df.copy(deep=False)
+        for c, dtype in target.items():
+            if isinstance(dtype, pd.CategoricalDtype) and df[c].dtype != dtype:
+                df[c] = df[c].astype(dtype)
+        result.append(df)
     return result